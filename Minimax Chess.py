@@ -1,9 +1,12 @@
 import pygame
 import chess
+import json
+import os
 import time
 import threading
+import queue
+import engine
 
-pygame.init()
 board_size = 640
 extra_panel_width = 160
 width, height = board_size + 2 * extra_panel_width, board_size
@@ -24,14 +27,37 @@ game_over_text = ""
 score_updated = False
 black_depth = 2
 white_depth = 2
+black_time_limit = None
+white_time_limit = None
+black_search_stats = None
+white_search_stats = None
+trace_directory = None
+book_file = "book.bin"
+cache_file = None
+trace_path = None
+ponder_enabled = True
+search_jobs = queue.Queue()
+search_results = queue.Queue()
+search_worker = None
+search_job = None
+job_counter = 0
+ai_move_delay = 0.35
+ai_move_ready_at = 0
 black_eval_choice = 1
 white_eval_choice = 1
 difficulty_selected = True
 show_restart = False
-restart_button = None
+restart_button = pygame.Rect(extra_panel_width + board_size + 10, height - 60, 120, 40)
 is_white_ai_enabled = True
-font = pygame.font.SysFont("Arial", 24)
-large_font = pygame.font.SysFont("Arial", 56)
+time_limits = {"1s": 1000, "3s": 3000, "10s": 10000}
+# Rendering only redraws an area when the state shown there changes, and
+# only pushes those areas to the display.
+render_cache = {}
+text_cache = {}
+panel_keys = {}
+panel_buttons = {}
+board_key = None
+dirty_rects = []
 
 def load_piece_images():
     pieces = ["r", "n", "b", "q", "k", "p"]
@@ -41,12 +67,45 @@ def load_piece_images():
             image = pygame.transform.scale(image, (square_size, square_size))
             piece_images[color + piece] = image
 
-def draw_board(screen):
+def load_render_cache():
+    board_surface = pygame.Surface((board_size, board_size))
     for row in range(8):
         for col in range(8):
             color = colors[(row + col) % 2]
-            rect = pygame.Rect(extra_panel_width + col * square_size, row * square_size, square_size, square_size)
-            pygame.draw.rect(screen, color, rect)
+            pygame.draw.rect(board_surface, color, pygame.Rect(col * square_size, row * square_size, square_size, square_size))
+    render_cache["board"] = board_surface.convert()
+
+    capture_highlight = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
+    capture_highlight.fill((255, 0, 0))
+    render_cache["capture"] = capture_highlight
+    move_highlight = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
+    move_highlight.fill((0, 255, 0, 128))
+    render_cache["move"] = move_highlight
+
+    box_width, box_height = board_size - 20, 100
+    promotion_box = pygame.Surface((box_width, box_height), pygame.SRCALPHA)
+    promotion_box.fill((0, 0, 0, 180))
+    num_options = len(promotion_choises)
+    image_size = 60
+    spacing = (box_width - num_options * image_size) // (num_options + 1)
+    for i, piece_type in enumerate(promotion_choises):
+        option_image = pygame.transform.scale(piece_images[promotion_image_keys[piece_type]], (image_size, image_size))
+        promotion_box.blit(option_image, (spacing + i * (image_size + spacing), (box_height - image_size) // 2))
+    render_cache["promotion"] = promotion_box
+
+def render_text(text_font, text, color):
+    key = (text_font, text, color)
+    label = text_cache.get(key)
+    if label is None:
+        # Live search stats produce new strings every frame.
+        if len(text_cache) > 512:
+            text_cache.clear()
+        label = text_font.render(text, True, color)
+        text_cache[key] = label
+    return label
+
+def draw_board(screen):
+    screen.blit(render_cache["board"], (extra_panel_width, 0))
 
 def draw_pieces(screen, board):
     for square in chess.SQUARES:
@@ -61,194 +120,11 @@ def draw_legal_moves(screen, board, selected_square):
         for move in board.legal_moves:
             if move.from_square == selected_square:
                 row, col = divmod(move.to_square, 8)
-                square_rect = pygame.Rect(extra_panel_width + col * square_size, (7 - row) * square_size, square_size, square_size)
+                position = (extra_panel_width + col * square_size, (7 - row) * square_size)
                 if board.piece_at(move.to_square) is not None:
-                    highlight_surface = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
-                    highlight_surface.fill((255, 0, 0))
-                    screen.blit(highlight_surface, square_rect.topleft)
+                    screen.blit(render_cache["capture"], position)
                 else:
-                    highlight_surface = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
-                    highlight_surface.fill((0, 255, 0, 128))
-                    screen.blit(highlight_surface, square_rect.topleft)
-
-
-def evaluate_board_1(board):
-    piece_values = {chess.PAWN: 100, chess.KNIGHT: 320, chess.BISHOP: 330, chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 20000}
-    score = 0
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece:
-            value = piece_values[piece.piece_type]
-            if piece.color == chess.WHITE:
-                score += value 
-            else:
-                score -= value 
-    return score
-
-def evaluate_board_2(board):
-    piece_values = {chess.PAWN: 100, chess.KNIGHT: 320, chess.BISHOP: 330, chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 20000}
-    score = 0
-    if board.is_checkmate():
-        return 2000000
-    if board.is_check():
-        score += 50 if board.turn == chess.WHITE else -50
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece:
-            value = piece_values[piece.piece_type]
-            if piece.color == chess.WHITE:
-                score += value 
-            else:
-                score -= value 
-    return score
-
-def evaluate_board_3(board):
-    piece_values = {chess.PAWN: 100, chess.KNIGHT: 320, chess.BISHOP: 330, chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 20000}
-    pawn_table = [
-         0,  0,  0,   0,   0,  0,  0,  0,
-         5, 10, 10, -20, -20, 10, 10,  5,
-         5, -5,-10,   0,   0,-10, -5,  5,
-         0,  0,  0,  20,  20,  0,  0,  0,
-         5,  5, 10,  25,  25, 10,  5,  5,
-        10, 10, 20,  30,  30, 20, 10, 10,
-        50, 50, 50,  50,  50, 50, 50, 50,
-         0,  0,  0,   0,   0,  0,  0,  0
-    ]
-    knight_table = [
-        -50,-40,-30,-30,-30,-30,-40,-50,
-        -40,-20,  0,  0,  0,  0,-20,-40,
-        -30,  0, 10, 15, 15, 10,  0,-30,
-        -30,  5, 15, 20, 20, 15,  5,-30,
-        -30,  0, 15, 20, 20, 15,  0,-30,
-        -30,  5, 10, 15, 15, 10,  5,-30,
-        -40,-20,  0,  5,  5,  0,-20,-40,
-        -50,-40,-30,-30,-30,-30,-40,-50
-    ]
-    bishop_table = [
-        -20,-10,-10,-10,-10,-10,-10,-20,
-        -10,  0,  0,  0,  0,  0,  0,-10,
-        -10,  0,  5, 10, 10,  5,  0,-10,
-        -10,  5,  5, 10, 10,  5,  5,-10,
-        -10,  0, 10, 10, 10, 10,  0,-10,
-        -10, 10, 10, 10, 10, 10, 10,-10,
-        -10,  5,  0,  0,  0,  0,  5,-10,
-        -20,-10,-10,-10,-10,-10,-10,-20
-    ]
-    rook_table = [
-         0,  0,  0,  0,  0,  0,  0,  0,
-         5, 10, 10, 10, 10, 10, 10,  5,
-        -5,  0,  0,  0,  0,  0,  0, -5,
-        -5,  0,  0,  0,  0,  0,  0, -5,
-        -5,  0,  0,  0,  0,  0,  0, -5,
-        -5,  0,  0,  0,  0,  0,  0, -5,
-        -5,  0,  0,  0,  0,  0,  0, -5,
-         0,  0,  0,  5,  5,  0,  0,  0
-    ]
-    queen_table = [
-        -20,-10,-10, -5, -5,-10,-10,-20,
-        -10,  0,  0,  0,  0,  0,  0,-10,
-        -10,  0,  5,  5,  5,  5,  0,-10,
-         -5,  0,  5,  5,  5,  5,  0, -5,
-          0,  0,  5,  5,  5,  5,  0, -5,
-        -10,  5,  5,  5,  5,  5,  0,-10,
-        -10,  0,  5,  0,  0,  0,  0,-10,
-        -20,-10,-10, -5, -5,-10,-10,-20
-    ]
-    king_table = [
-        -30,-40,-40,-50,-50,-40,-40,-30,
-        -30,-40,-40,-50,-50,-40,-40,-30,
-        -30,-40,-40,-50,-50,-40,-40,-30,
-        -30,-40,-40,-50,-50,-40,-40,-30,
-        -20,-30,-30,-40,-40,-30,-30,-20,
-        -10,-20,-20,-20,-20,-20,-20,-10,
-         20, 20,  0,  0,  0,  0, 20, 20,
-         20, 30, 10,  0,  0, 10, 30, 20
-    ]
-    piece_square_tables = {chess.PAWN: pawn_table, chess.KNIGHT: knight_table, chess.BISHOP: bishop_table, chess.ROOK: rook_table, chess.QUEEN: queen_table, chess.KING: king_table }
-
-    score = 0
-    if board.is_checkmate():
-        return 2000000
-    if board.is_check():
-        score += 50 if board.turn == chess.WHITE else -50
-
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece:
-            value = piece_values[piece.piece_type]
-            table = piece_square_tables[piece.piece_type]
-            if piece.color == chess.WHITE:
-                pos_value = table[square]
-            else:
-                pos_value = table[chess.square_mirror(square)]
-            if piece.color == chess.WHITE:
-                score += value + pos_value
-            else:
-                score -= value + pos_value
-    return score
-
-def minimax(board, depth, alpha, beta, maximizing):
-    if board.is_checkmate():
-        return -2000000 if maximizing else 2000000
-    if board.is_stalemate() or board.is_insufficient_material() or board.is_repetition():
-        return 0
-    if depth == 0:
-        if not white_ai_thinking:
-            if black_eval_choice == 1 :
-                return evaluate_board_1(board)
-            if black_eval_choice == 2 :
-                return evaluate_board_2(board)
-            if black_eval_choice == 3 :
-                return evaluate_board_3(board)
-        else:
-            if white_eval_choice == 1 :
-                return -evaluate_board_1(board)
-            if white_eval_choice == 2 :
-                return -evaluate_board_2(board)
-            if white_eval_choice == 3 :
-                return -evaluate_board_3(board)
-            
-    legal_moves = list(board.legal_moves)
-    if maximizing:
-        max_eval = float('-inf')
-        for move in legal_moves:
-            board.push(move)
-            eval_score = minimax(board, depth - 1, alpha, beta, False)
-            board.pop()
-            max_eval = max(max_eval, eval_score)
-            if max_eval >= beta:
-                return max_eval
-            alpha = max(alpha, eval_score)
-        return max_eval
-    else:
-        min_eval = float('inf')
-        for move in legal_moves:
-            board.push(move)
-            eval_score = minimax(board, depth - 1, alpha, beta, True)
-            board.pop()
-            min_eval = min(min_eval, eval_score)
-            if min_eval <= alpha:
-                return min_eval
-            beta = min(beta, eval_score)
-        return min_eval
-
-def get_best_move(board, depth):
-    best_move = None
-    min_eval = float('inf')
-    alpha = float('-inf')
-    beta = float('inf')
-    legal_moves = list(board.legal_moves)
-    for move in legal_moves:
-        board.push(move)
-        if board.is_checkmate():
-            board.pop()
-            return move
-        eval_score = minimax(board, depth - 1, alpha, beta, True)
-        board.pop()
-        if eval_score < min_eval:
-            min_eval = eval_score
-            best_move = move
-    return best_move
+                    screen.blit(render_cache["move"], position)
 
 def check_pawn_promotion_ai():
     for square in chess.SQUARES:
@@ -257,37 +133,141 @@ def check_pawn_promotion_ai():
             if piece.color == chess.BLACK and square // 8 == 0:
                 board.push(chess.Move(square, square, promotion=chess.QUEEN))
 
-def white_ai_move():
-    global board, ai_thinking, white_ai_thinking, is_white_ai_enabled
+def new_trace_path():
+    if trace_directory is None:
+        return None
+    os.makedirs(trace_directory, exist_ok=True)
+    return os.path.join(trace_directory, time.strftime("game-%Y%m%d-%H%M%S.jsonl"))
+
+def write_trace(side, fen, stats):
+    if trace_path is None:
+        return
+    record = {"side": side, "fen": fen}
+    record.update(stats.to_dict())
+    with open(trace_path, "a") as trace_file:
+        trace_file.write(json.dumps(record) + "\n")
+
+def search_worker_loop():
+    # The only thread that searches. Jobs are (job_id, board, settings);
+    # results go back to the main loop, which owns the game board.
+    while True:
+        job = search_jobs.get()
+        if job is None:
+            return
+        job_id, search_board, settings = job
+        # Reset before checking the id so a cancel that lands in between
+        # still stops the search.
+        engine.stop_requested = False
+        if job_id != job_counter:
+            continue
+        depth, time_limit, eval_choice = settings
+        if time_limit:
+            result = engine.search_with_stats(search_board, time_limit_ms=time_limit, eval_choice=eval_choice)
+        else:
+            result = engine.search_with_stats(search_board, depth, eval_choice=eval_choice, interruptible=True)
+        search_results.put((job_id, result))
+
+def start_search_worker():
+    global search_worker
+    search_worker = threading.Thread(target=search_worker_loop, daemon=True)
+    search_worker.start()
+
+def stop_search_worker():
+    cancel_search()
+    search_jobs.put(None)
+    search_worker.join()
+
+def search_settings(side):
+    if side == chess.WHITE:
+        return (white_depth, white_time_limit, white_eval_choice)
+    return (black_depth, black_time_limit, black_eval_choice)
+
+def cancel_search():
+    global job_counter, search_job
+    job_counter += 1
+    engine.stop_search()
+    search_job = None
+
+def submit_search(kind, side, search_board, settings, expected=None):
+    global search_job
+    cancel_search()
+    search_job = {"id": job_counter, "kind": kind, "side": side, "settings": settings, "expected": expected, "result": None}
+    search_jobs.put((job_counter, search_board, settings))
+
+def request_ai_move(side):
+    global ai_thinking, white_ai_thinking, is_white_ai_enabled, ai_move_ready_at
     if board.is_game_over():
-        white_ai_thinking = False
+        cancel_search()
         ai_thinking = False
+        white_ai_thinking = False
         is_white_ai_enabled = False
         return
-    best_move = get_best_move(board, white_depth)
+    ai_thinking = True
+    white_ai_thinking = side == chess.WHITE
+    ai_move_ready_at = time.time() + (ai_move_delay if side == chess.BLACK else 0)
+    settings = search_settings(side)
+    # A ponder search on the move the human just played becomes the move search.
+    if (side == chess.BLACK and search_job is not None and search_job["kind"] == "ponder"
+            and board.move_stack and board.peek() == search_job["expected"] and search_job["settings"] == settings):
+        search_job["kind"] = "move"
+        return
+    submit_search("move", side, board.copy(), settings)
+
+def start_pondering():
+    if not ponder_enabled or board.is_game_over():
+        return
+    expected = engine.expected_reply(board, black_eval_choice)
+    if expected is None:
+        return
+    ponder_board = board.copy()
+    ponder_board.push(expected)
+    if ponder_board.is_game_over():
+        return
+    submit_search("ponder", chess.BLACK, ponder_board, search_settings(chess.BLACK), expected)
+
+def settings_changed(side):
+    # Restarts a running search for that side with the new settings.
+    if search_job is None or search_job["side"] != side:
+        return
+    if search_job["kind"] == "move":
+        request_ai_move(side)
+    else:
+        cancel_search()
+
+def update_search():
+    global search_job
+    while True:
+        try:
+            job_id, result = search_results.get_nowait()
+        except queue.Empty:
+            break
+        if search_job is not None and job_id == search_job["id"]:
+            search_job["result"] = result
+    if search_job is None or search_job["kind"] != "move" or search_job["result"] is None or time.time() < ai_move_ready_at:
+        return
+    job = search_job
+    search_job = None
+    apply_ai_move(job["side"], job["result"])
+
+def apply_ai_move(side, result):
+    global ai_thinking, white_ai_thinking, is_white_ai_enabled, white_search_stats, black_search_stats
+    best_move, stats = result
+    write_trace("white" if side == chess.WHITE else "black", board.fen(), stats)
+    if side == chess.WHITE:
+        white_search_stats = stats
+    else:
+        black_search_stats = stats
     if best_move:
         board.push(best_move)
         check_pawn_promotion_ai()
-    ai_thinking = False
-    white_ai_thinking = False
-    time.sleep(0.35)
-    ai_move()
-
-def ai_move():
-    global board, ai_thinking, white_ai_thinking, is_white_ai_enabled
-    if not white_ai_thinking:
-        ai_thinking = True
-        if board.is_game_over():
-            ai_thinking = False
-            is_white_ai_enabled = False
-            return
-        best_move = get_best_move(board, black_depth)
-        if best_move:
-            time.sleep(0.35)
-            board.push(best_move)
-            check_pawn_promotion_ai()
+    if side == chess.WHITE:
+        white_ai_thinking = False
+        request_ai_move(chess.BLACK)
+    else:
         ai_thinking = False
         is_white_ai_enabled = True
+        if best_move:
+            start_pondering()
 
 def show_promotion_options(square):
     global promotion_active, promotion_square, selected_promotion_piece
@@ -297,21 +277,7 @@ def show_promotion_options(square):
 
 def draw_promotion_box(screen):
     if promotion_active:
-        box_x, box_y = extra_panel_width + 10, 270
-        box_width, box_height = board_size - 20, 100
-        promotion_box = pygame.Surface((box_width, box_height), pygame.SRCALPHA)
-        promotion_box.fill((0, 0, 0, 180))
-        num_options = len(promotion_choises)
-        image_size = 60
-        spacing = (box_width - num_options * image_size) // (num_options + 1)
-
-        for i, piece_type in enumerate(promotion_choises):
-            key = promotion_image_keys[piece_type]
-            option_image = pygame.transform.scale(piece_images[key], (image_size, image_size))
-            option_x = spacing + i * (image_size + spacing)
-            option_y = (box_height - image_size) // 2
-            promotion_box.blit(option_image, (option_x, option_y))
-        screen.blit(promotion_box, (box_x, box_y))
+        screen.blit(render_cache["promotion"], (extra_panel_width + 10, 270))
 
 def handle_promotion_choice(mouse_pos):
     global promotion_active, selected_promotion_piece, pending_move, ai_thinking
@@ -342,19 +308,42 @@ def handle_promotion_choice(mouse_pos):
                 draw_pieces(screen, board)
                 draw_promotion_box(screen)
                 pygame.display.flip()
-                threading.Thread(target=ai_move, daemon=True).start()
+                request_ai_move(chess.BLACK)
 
 def draw_center_text(surface, text, pos, color=(255,255,255)):
-    label = large_font.render(text, True, color)
+    label = render_text(large_font, text, color)
     rect = label.get_rect(center=pos)
     surface.blit(label, rect)
 
+def search_stats_lines(stats):
+    if stats is None:
+        return ()
+    if stats.book:
+        return ("book move",)
+    if stats.cached:
+        return (f"d{stats.depth}  cached",)
+    return (f"d{stats.depth}  {stats.node_count()} nodes" if stats.finished else f"{stats.node_count()} nodes",
+            f"{stats.nps():.0f} nps  bf {stats.branching_factor():.1f}")
+
+def draw_search_stats(screen, lines, x, y):
+    for line in lines:
+        label = render_text(small_font, line, (0,0,0))
+        screen.blit(label, (x, y))
+        y += 14
+
 def draw_left_panel(screen):
+    live_stats = engine.search_stats if ai_thinking and not white_ai_thinking else None
+    stats_lines = search_stats_lines(live_stats or black_search_stats)
+    turn_text = "White's turn" if board.turn == chess.WHITE and not ai_thinking else "Black's turn"
+    key = (black_depth, black_time_limit, black_eval_choice, stats_lines, turn_text, player_wins, computer_wins)
+    if panel_keys.get("left") == key:
+        return panel_buttons["left"]
+    panel_keys["left"] = key
     panel_rect = pygame.Rect(0, 0, extra_panel_width, height)
     pygame.draw.rect(screen, (200, 200, 200), panel_rect)
-    title = font.render("Black AI", True, (0,0,0))
+    title = render_text(font, "Black AI", (0,0,0))
     screen.blit(title, (10, 10))
-    depth_title = font.render("Depth", True, (0,0,0))
+    depth_title = render_text(font, "Depth", (0,0,0))
     screen.blit(depth_title, (10, 50))
     btn_width, btn_height = 120, 40
     gap = 10
@@ -364,14 +353,14 @@ def draw_left_panel(screen):
 
     for label_text, d in depths.items():
         btn_rect = pygame.Rect(10, btn_y, btn_width, btn_height)
-        color_btn = (0, 200, 0) if black_depth == d else (100, 100, 100)
+        color_btn = (0, 200, 0) if black_depth == d and black_time_limit is None else (100, 100, 100)
         pygame.draw.rect(screen, color_btn, btn_rect)
-        txt = font.render(label_text, True, (255,255,255))
+        txt = render_text(font, label_text, (255,255,255))
         screen.blit(txt, txt.get_rect(center=btn_rect.center))
         black_depth_buttons[label_text] = btn_rect
         btn_y += btn_height + gap
 
-    eval_title = font.render("Eval", True, (0,0,0))
+    eval_title = render_text(font, "Eval", (0,0,0))
     screen.blit(eval_title, (10, btn_y + gap))
     btn_y += gap + 30
     black_eval_buttons = {}
@@ -381,26 +370,51 @@ def draw_left_panel(screen):
         btn_rect = pygame.Rect(10, btn_y, btn_width, btn_height)
         color_btn = (0, 200, 0) if black_eval_choice == val else (100, 100, 100)
         pygame.draw.rect(screen, color_btn, btn_rect)
-        txt = font.render(label_text, True, (255,255,255))
+        txt = render_text(font, label_text, (255,255,255))
         screen.blit(txt, txt.get_rect(center=btn_rect.center))
         black_eval_buttons[label_text] = btn_rect
         btn_y += btn_height + gap
 
-    turn_text = "White's turn" if board.turn == chess.WHITE and not ai_thinking else "Black's turn"
-    turn_label = font.render(turn_text, True, (0,0,0))
+    time_title = render_text(font, "Time", (0,0,0))
+    screen.blit(time_title, (10, btn_y))
+    btn_y += 30
+    black_time_buttons = {}
+    time_x = 10
+
+    for label_text, ms in time_limits.items():
+        btn_rect = pygame.Rect(time_x, btn_y, 40, 30)
+        color_btn = (0, 200, 0) if black_time_limit == ms else (100, 100, 100)
+        pygame.draw.rect(screen, color_btn, btn_rect)
+        txt = render_text(font, label_text, (255,255,255))
+        screen.blit(txt, txt.get_rect(center=btn_rect.center))
+        black_time_buttons[label_text] = btn_rect
+        time_x += 45
+
+    draw_search_stats(screen, stats_lines, 10, btn_y + 32)
+
+    turn_label = render_text(font, turn_text, (0,0,0))
     screen.blit(turn_label, (10, height - 110))
-    score_label = font.render(f"Player: {player_wins}", True, (0,0,0))
+    score_label = render_text(font, f"Player: {player_wins}", (0,0,0))
     screen.blit(score_label, (10, height - 75))
-    score_label2 = font.render(f"Computer: {computer_wins}", True, (0,0,0))
+    score_label2 = render_text(font, f"Computer: {computer_wins}", (0,0,0))
     screen.blit(score_label2, (10, height - 45))
-    return black_depth_buttons, black_eval_buttons
+    dirty_rects.append(panel_rect)
+    panel_buttons["left"] = black_depth_buttons, black_eval_buttons, black_time_buttons
+    return panel_buttons["left"]
 
 def draw_right_panel(screen):
+    live_stats = engine.search_stats if white_ai_thinking else None
+    stats_lines = search_stats_lines(live_stats or white_search_stats)
+    game_over_shown = board.is_game_over() and not ai_thinking and not white_ai_thinking
+    key = (white_depth, white_time_limit, white_eval_choice, stats_lines, game_over_shown)
+    if panel_keys.get("right") == key:
+        return panel_buttons["right"]
+    panel_keys["right"] = key
     panel_rect = pygame.Rect(extra_panel_width + board_size, 0, extra_panel_width, height)
     pygame.draw.rect(screen, (200, 200, 200), panel_rect)
-    title = font.render("White AI", True, (0,0,0))
+    title = render_text(font, "White AI", (0,0,0))
     screen.blit(title, (extra_panel_width + board_size + 10, 10))
-    depth_title = font.render("Depth", True, (0,0,0))
+    depth_title = render_text(font, "Depth", (0,0,0))
     screen.blit(depth_title, (extra_panel_width + board_size + 10, 50))
     btn_width, btn_height = 120, 40
     gap = 10
@@ -410,14 +424,14 @@ def draw_right_panel(screen):
 
     for label_text, d in depths.items():
         btn_rect = pygame.Rect(extra_panel_width + board_size + 10, btn_y, btn_width, btn_height)
-        color_btn = (0, 200, 0) if white_depth == d else (100, 100, 100)
+        color_btn = (0, 200, 0) if white_depth == d and white_time_limit is None else (100, 100, 100)
         pygame.draw.rect(screen, color_btn, btn_rect)
-        txt = font.render(label_text, True, (255,255,255))
+        txt = render_text(font, label_text, (255,255,255))
         screen.blit(txt, txt.get_rect(center=btn_rect.center))
         white_depth_buttons[label_text] = btn_rect
         btn_y += btn_height + gap
 
-    eval_title = font.render("Eval", True, (0,0,0))
+    eval_title = render_text(font, "Eval", (0,0,0))
     screen.blit(eval_title, (extra_panel_width + board_size + 10, btn_y + gap))
     btn_y += gap + 30
     white_eval_buttons = {}
@@ -427,26 +441,46 @@ def draw_right_panel(screen):
         btn_rect = pygame.Rect(extra_panel_width + board_size + 10, btn_y, btn_width, btn_height)
         color_btn = (0, 200, 0) if white_eval_choice == val else (100, 100, 100)
         pygame.draw.rect(screen, color_btn, btn_rect)
-        txt = font.render(label_text, True, (255,255,255))
+        txt = render_text(font, label_text, (255,255,255))
         screen.blit(txt, txt.get_rect(center=btn_rect.center))
         white_eval_buttons[label_text] = btn_rect
         btn_y += btn_height + gap
 
+    time_title = render_text(font, "Time", (0,0,0))
+    screen.blit(time_title, (extra_panel_width + board_size + 10, btn_y))
+    btn_y += 30
+    white_time_buttons = {}
+    time_x = extra_panel_width + board_size + 10
+
+    for label_text, ms in time_limits.items():
+        btn_rect = pygame.Rect(time_x, btn_y, 40, 30)
+        color_btn = (0, 200, 0) if white_time_limit == ms else (100, 100, 100)
+        pygame.draw.rect(screen, color_btn, btn_rect)
+        txt = render_text(font, label_text, (255,255,255))
+        screen.blit(txt, txt.get_rect(center=btn_rect.center))
+        white_time_buttons[label_text] = btn_rect
+        time_x += 45
+
+    draw_search_stats(screen, stats_lines, extra_panel_width + board_size + 10, btn_y + 32)
+
     white_ai_button = pygame.Rect(extra_panel_width + board_size + 10, height - 120, 120, 40)
     pygame.draw.rect(screen, (50, 50, 200), white_ai_button)
-    white_ai_text = font.render("White AI", True, (255,255,255))
+    white_ai_text = render_text(font, "White AI", (255,255,255))
     screen.blit(white_ai_text, white_ai_text.get_rect(center=white_ai_button.center))
-    return white_depth_buttons, white_eval_buttons, white_ai_button
+    if game_over_shown:
+        draw_restart_button(screen)
+    dirty_rects.append(panel_rect)
+    panel_buttons["right"] = white_depth_buttons, white_eval_buttons, white_time_buttons, white_ai_button
+    return panel_buttons["right"]
 
 def draw_restart_button(screen):
-    restart_button = pygame.Rect(extra_panel_width + board_size + 10, height - 60, 120, 40)
     pygame.draw.rect(screen, (150, 50, 50), restart_button)
-    restart_text = font.render("Restart", True, (255,255,255))
+    restart_text = render_text(font, "Restart", (255,255,255))
     screen.blit(restart_text, restart_text.get_rect(center=restart_button.center))
     return restart_button
     
 def restart_game():
-    global board, selected_square, promotion_active, pending_move, score_updated, game_over_text, ai_thinking, is_white_ai_enabled, white_ai_thinking
+    global board, selected_square, promotion_active, pending_move, score_updated, game_over_text, ai_thinking, is_white_ai_enabled, white_ai_thinking, trace_path
     board = chess.Board()
     selected_square = None
     promotion_active = False
@@ -456,135 +490,170 @@ def restart_game():
     ai_thinking = False
     white_ai_thinking = False
     is_white_ai_enabled = True
-
-screen = pygame.display.set_mode((width, height))
-pygame.display.set_caption("Minimax Chess")
-load_piece_images()
-board = chess.Board()
-running = True
-selected_square = None
-ai_thinking = False
-clock = pygame.time.Clock()
-
-while running:
-    clock.tick(30)
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        if board.is_game_over() and event.type == pygame.MOUSEBUTTONDOWN:
-            _ = draw_restart_button(screen)
-            if restart_button.collidepoint(event.pos):
-                restart_game()
-            continue
-
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            if promotion_active:
-                handle_promotion_choice(event.pos)
-                continue
-            x, y = event.pos
-            if x < extra_panel_width:
-                b_depth_btns, b_eval_btns = draw_left_panel(screen)
-                for label, btn in b_depth_btns.items():
-                    if btn.collidepoint(event.pos):
-                        if label == "Easy":
-                            black_depth = 2
-                        elif label == "Medium":
-                            black_depth = 3
-                        elif label == "Hard":
-                            black_depth = 4
-                for label, btn in b_eval_btns.items():
-                    if btn.collidepoint(event.pos):
-                        black_eval_choice = {"E1":1, "E2":2, "E3":3}[label]
-                continue
-            
-            if x > extra_panel_width + board_size:
-                w_depth_btns, w_eval_btns, white_ai_btn = draw_right_panel(screen)
-                for label, btn in w_depth_btns.items():
-                    if btn.collidepoint(event.pos):
-                        if label == "Easy":
-                            white_depth = 2
-                        elif label == "Medium":
-                            white_depth = 3
-                        elif label == "Hard":
-                            white_depth = 4
-                for label, btn in w_eval_btns.items():
-                    if btn.collidepoint(event.pos):
-                        white_eval_choice = {"E1":1, "E2":2, "E3":3}[label]
-
-                if white_ai_btn.collidepoint(event.pos) and is_white_ai_enabled and not board.is_game_over():
-                    is_white_ai_enabled = False
-                    draw_board(screen)
-                    draw_legal_moves(screen, board, selected_square)
-                    draw_pieces(screen, board)
-                    draw_promotion_box(screen)
-                    pygame.display.flip()
-                    ai_thinking = True
-                    white_ai_thinking = True
-                    threading.Thread(target=white_ai_move, daemon=True).start()
+    cancel_search()
+    trace_path = new_trace_path()
+    engine.new_game()
+
+if __name__ == "__main__":
+    pygame.init()
+    font = pygame.font.SysFont("Arial", 24)
+    large_font = pygame.font.SysFont("Arial", 56)
+    small_font = pygame.font.SysFont("Arial", 14)
+    trace_path = new_trace_path()
+    if os.path.exists(book_file):
+        engine.open_book(book_file)
+    if cache_file is not None:
+        engine.open_position_cache(cache_file)
+    screen = pygame.display.set_mode((width, height))
+    pygame.display.set_caption("Minimax Chess")
+    load_piece_images()
+    load_render_cache()
+    board = chess.Board()
+    running = True
+    selected_square = None
+    ai_thinking = False
+    clock = pygame.time.Clock()
+    start_search_worker()
+
+    while running:
+        clock.tick(30)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+                stop_search_worker()
+                engine.shutdown_search_pool()
+                engine.close_position_cache()
+            if board.is_game_over() and event.type == pygame.MOUSEBUTTONDOWN:
+                if restart_button.collidepoint(event.pos):
+                    restart_game()
                 continue
 
-            if extra_panel_width <= x <= extra_panel_width + board_size and y < board_size:
-                board_x = x - extra_panel_width
-                col, row = board_x // square_size, y // square_size
-                square = chess.square(col, 7 - row)
-                if selected_square is None:
-                    if board.piece_at(square) and board.piece_at(square).color == chess.WHITE and not ai_thinking and not white_ai_thinking:
-                        selected_square = square
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                if promotion_active:
+                    handle_promotion_choice(event.pos)
+                    continue
+                x, y = event.pos
+                if x < extra_panel_width:
+                    old_settings = search_settings(chess.BLACK)
+                    b_depth_btns, b_eval_btns, b_time_btns = draw_left_panel(screen)
+                    for label, btn in b_depth_btns.items():
+                        if btn.collidepoint(event.pos):
+                            black_time_limit = None
+                            if label == "Easy":
+                                black_depth = 2
+                            elif label == "Medium":
+                                black_depth = 3
+                            elif label == "Hard":
+                                black_depth = 4
+                    for label, btn in b_time_btns.items():
+                        if btn.collidepoint(event.pos):
+                            black_time_limit = time_limits[label]
+                    for label, btn in b_eval_btns.items():
+                        if btn.collidepoint(event.pos):
+                            black_eval_choice = {"E1":1, "E2":2, "E3":3}[label]
+                    if search_settings(chess.BLACK) != old_settings:
+                        settings_changed(chess.BLACK)
+                    continue
+
+                if x > extra_panel_width + board_size:
+                    old_settings = search_settings(chess.WHITE)
+                    w_depth_btns, w_eval_btns, w_time_btns, white_ai_btn = draw_right_panel(screen)
+                    for label, btn in w_depth_btns.items():
+                        if btn.collidepoint(event.pos):
+                            white_time_limit = None
+                            if label == "Easy":
+                                white_depth = 2
+                            elif label == "Medium":
+                                white_depth = 3
+                            elif label == "Hard":
+                                white_depth = 4
+                    for label, btn in w_time_btns.items():
+                        if btn.collidepoint(event.pos):
+                            white_time_limit = time_limits[label]
+                    for label, btn in w_eval_btns.items():
+                        if btn.collidepoint(event.pos):
+                            white_eval_choice = {"E1":1, "E2":2, "E3":3}[label]
+                    if search_settings(chess.WHITE) != old_settings:
+                        settings_changed(chess.WHITE)
+
+                    if white_ai_btn.collidepoint(event.pos) and is_white_ai_enabled and not board.is_game_over():
+                        is_white_ai_enabled = False
+                        draw_board(screen)
+                        draw_legal_moves(screen, board, selected_square)
+                        draw_pieces(screen, board)
+                        draw_promotion_box(screen)
+                        pygame.display.flip()
+                        request_ai_move(chess.WHITE)
+                    continue
+
+                if extra_panel_width <= x <= extra_panel_width + board_size and y < board_size:
+                    board_x = x - extra_panel_width
+                    col, row = board_x // square_size, y // square_size
+                    square = chess.square(col, 7 - row)
+                    if selected_square is None:
+                        if board.piece_at(square) and board.piece_at(square).color == chess.WHITE and not ai_thinking and not white_ai_thinking:
+                            selected_square = square
+                    else:
+                        move = chess.Move(selected_square, square)
+                        if board.piece_at(selected_square).piece_type == chess.PAWN and square // 8 == 7:
+                            for piece in ['q', 'b', 'r', 'n']:
+                                for legal_move in list(board.legal_moves):
+                                    if str(move) + piece == str(legal_move):
+                                        pending_move = move
+                                        show_promotion_options(square)
+                        if move in board.legal_moves:
+                            board.push(move)
+                            if not board.is_game_over():
+                                draw_board(screen)
+                                draw_legal_moves(screen, board, selected_square)
+                                draw_pieces(screen, board)
+                                draw_promotion_box(screen)
+                                pygame.display.flip()
+                                request_ai_move(chess.BLACK)
+                        selected_square = None
+
+        update_search()
+        left_depth_btns, left_eval_btns, left_time_btns = draw_left_panel(screen)
+        right_depth_btns, right_eval_btns, right_time_btns, white_ai_btn = draw_right_panel(screen)
+
+        if board.is_game_over() and not score_updated and not white_ai_thinking and not ai_thinking:
+            if board.is_checkmate():
+                if board.turn == chess.WHITE:
+                    game_over_text = "Checkmate!\nBlack wins"
+                    computer_wins += 1
                 else:
-                    move = chess.Move(selected_square, square)
-                    if board.piece_at(selected_square).piece_type == chess.PAWN and square // 8 == 7:
-                        for piece in ['q', 'b', 'r', 'n']:
-                            for legal_move in list(board.legal_moves):
-                                if str(move) + piece == str(legal_move):
-                                    pending_move = move
-                                    show_promotion_options(square)
-                    if move in board.legal_moves:
-                        board.push(move)
-                        if not board.is_game_over():
-                            draw_board(screen)
-                            draw_legal_moves(screen, board, selected_square)
-                            draw_pieces(screen, board)
-                            draw_promotion_box(screen)
-                            pygame.display.flip()
-                            threading.Thread(target=ai_move, daemon=True).start()
-                    selected_square = None
-
-    if not white_ai_thinking or not ai_thinking:
-        left_depth_btns, left_eval_btns = draw_left_panel(screen)
-        right_depth_btns, right_eval_btns, white_ai_btn = draw_right_panel(screen)
-
-    if board.is_game_over() and not score_updated and not white_ai_thinking and not ai_thinking:
-        if board.is_checkmate():
-            if board.turn == chess.WHITE:
-                game_over_text = "Checkmate!\nBlack wins"
-                computer_wins += 1
-            else:
-                game_over_text = "Checkmate!\nWhite wins"
-                player_wins += 1
-        elif board.is_stalemate():
-            game_over_text = "Stalemate!"
-        elif board.is_insufficient_material():
-            game_over_text = "Draw: Insufficient material!"
-        elif board.can_claim_threefold_repetition():
-            game_over_text = "Draw: Threefold repetition!"
-        elif board.can_claim_fifty_moves():
-            game_over_text = "Draw: Fifty-move rule!"
-        score_updated = True
-
-    if not ai_thinking and not white_ai_thinking:
-        draw_board(screen)
-        draw_legal_moves(screen, board, selected_square)
-        draw_pieces(screen, board)
-        draw_promotion_box(screen)
-
-    if board.is_game_over() and not ai_thinking and not white_ai_thinking:
-        lines = game_over_text.split("\n")
-        y_offset = board_size // 2 - len(lines) * 20
-        for line in lines:
-            game_over_surface = large_font.render(line, True, (200, 0, 0))
-            screen.blit(game_over_surface, game_over_surface.get_rect(center=(extra_panel_width + board_size // 2, y_offset)))
-            y_offset += 70
-        restart_button = draw_restart_button(screen)
-
-    pygame.display.flip()
-pygame.quit()
\ No newline at end of file
+                    game_over_text = "Checkmate!\nWhite wins"
+                    player_wins += 1
+            elif board.is_stalemate():
+                game_over_text = "Stalemate!"
+            elif board.is_insufficient_material():
+                game_over_text = "Draw: Insufficient material!"
+            elif board.can_claim_threefold_repetition():
+                game_over_text = "Draw: Threefold repetition!"
+            elif board.can_claim_fifty_moves():
+                game_over_text = "Draw: Fifty-move rule!"
+            score_updated = True
+
+        # Redrawn whenever the position changes, including while the other
+        # side is already thinking about its reply.
+        game_over = board.is_game_over()
+        key = (board.fen(), selected_square, promotion_active, game_over, game_over_text)
+        if key != board_key:
+            board_key = key
+            draw_board(screen)
+            draw_legal_moves(screen, board, selected_square)
+            draw_pieces(screen, board)
+            draw_promotion_box(screen)
+            if game_over:
+                lines = game_over_text.split("\n")
+                y_offset = board_size // 2 - len(lines) * 20
+                for line in lines:
+                    game_over_surface = render_text(large_font, line, (200, 0, 0))
+                    screen.blit(game_over_surface, game_over_surface.get_rect(center=(extra_panel_width + board_size // 2, y_offset)))
+                    y_offset += 70
+            dirty_rects.append(pygame.Rect(extra_panel_width, 0, board_size, board_size))
+
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
+            dirty_rects.clear()
+    pygame.quit()
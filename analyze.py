@@ -0,0 +1,171 @@
+import argparse
+import collections
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import sys
+import time
+import chess
+import chess.pgn
+import engine
+
+def init_worker():
+    engine.search_workers = 1
+
+def analyze_position(fen, moves, depth, time_limit, eval_choice):
+    # Runs in a pool process; the moves leading to the position are replayed
+    # so repetitions are scored as draws. Tables are cleared so a score does
+    # not depend on which positions the worker happened to search before,
+    # which keeps resumed runs identical to uninterrupted ones.
+    engine.new_game()
+    board = chess.Board(fen)
+    for uci_move in moves:
+        board.push_uci(uci_move)
+    if time_limit:
+        move, stats = engine.search_with_stats(board, time_limit_ms=time_limit, eval_choice=eval_choice)
+    else:
+        move, stats = engine.search_with_stats(board, depth, eval_choice=eval_choice)
+    # Search scores are for the side to move; output is from White's side.
+    score = stats.score if board.turn == chess.WHITE else -stats.score
+    return move.uci() if move else None, score, stats.nodes
+
+def submit_game(pool, game, options):
+    board = game.board()
+    root_fen = board.fen()
+    moves = []
+    futures = []
+    for move in game.mainline_moves():
+        board.push(move)
+        moves.append(move.uci())
+        if board.is_game_over(claim_draw=True):
+            futures.append(None)
+        else:
+            futures.append(pool.submit(analyze_position, root_fen, list(moves), options["depth"], options["time"], options["eval"]))
+    return futures
+
+def format_eval(score):
+    if abs(score) >= engine.MATE_SCORE:
+        return "White mates" if score > 0 else "Black mates"
+    return f"[%eval {score / 100:+.2f}]"
+
+def annotate_game(game, results):
+    rows = []
+    board = game.board()
+    for node, result in zip(game.mainline(), results):
+        board.push(node.move)
+        row = {"ply": board.ply(), "move": node.move.uci(), "score": None, "mate": False, "best": None, "nodes": 0}
+        if result is not None:
+            best, score, nodes = result
+            row.update(score=score, mate=abs(score) >= engine.MATE_SCORE, best=best, nodes=nodes)
+            comment = format_eval(score)
+            if best:
+                comment += f" best {board.san(chess.Move.from_uci(best))}"
+            node.comment = f"{node.comment} {comment}".strip()
+        rows.append(row)
+    return rows
+
+def write_game(output, output_format, number, game, rows):
+    if output_format == "jsonl":
+        output.write(json.dumps({"game": number, "headers": dict(game.headers), "moves": rows}) + "\n")
+    else:
+        print(game, file=output, end="\n\n")
+
+def load_checkpoint(path, options):
+    with open(path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    if checkpoint["options"] != options:
+        raise SystemExit(f"checkpoint {path} was written with different options: {checkpoint['options']}")
+    return checkpoint
+
+def save_checkpoint(path, options, games, offset, output_bytes):
+    # Written to a temporary file and renamed so an interrupted run never
+    # leaves a half-written checkpoint behind.
+    with open(path + ".tmp", "w") as checkpoint_file:
+        json.dump({"options": options, "games": games, "offset": offset, "output_bytes": output_bytes}, checkpoint_file)
+    os.replace(path + ".tmp", path)
+
+def report_progress(games, positions, nodes, started, offset, total_bytes, final=False):
+    elapsed = time.perf_counter() - started
+    rate = positions / elapsed if elapsed > 0 else 0
+    percent = 100 * offset / total_bytes if total_bytes else 100
+    print(f"{games} games, {positions} positions, {rate:.1f} positions/s, {nodes / elapsed if elapsed > 0 else 0:.0f} nps, "
+          f"{offset / 1e6:.1f}/{total_bytes / 1e6:.1f} MB ({percent:.1f}%)", file=sys.stderr, end="\n" if final else "\r", flush=True)
+
+def run_analysis(input_path, output_path, options, workers, checkpoint_path=None, resume=False, max_in_flight=None):
+    output_format = options["format"]
+    games = 0
+    offset = 0
+    output_bytes = 0
+    if resume and checkpoint_path and os.path.exists(checkpoint_path):
+        checkpoint = load_checkpoint(checkpoint_path, options)
+        games, offset, output_bytes = checkpoint["games"], checkpoint["offset"], checkpoint["output_bytes"]
+        print(f"resuming after {games} games", file=sys.stderr)
+    max_in_flight = max_in_flight or workers * 8
+    total_bytes = os.path.getsize(input_path)
+    positions = nodes = 0
+    started = time.perf_counter()
+    last_report = started
+    context = multiprocessing.get_context("spawn")
+    output = open(output_path, "r+" if output_bytes else "w")
+    try:
+        # Anything written after the last checkpoint is thrown away and redone.
+        output.seek(output_bytes)
+        output.truncate()
+        with open(input_path, encoding="utf-8-sig") as pgn_file, \
+                concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker) as pool:
+            pgn_file.seek(offset)
+            pending = collections.deque()
+            in_flight = 0
+            reading = True
+            while reading or pending:
+                # Keep at most max_in_flight positions queued so memory stays
+                # flat however large the input is.
+                if reading and in_flight < max_in_flight:
+                    game = chess.pgn.read_game(pgn_file)
+                    if game is None:
+                        reading = False
+                        continue
+                    futures = submit_game(pool, game, options)
+                    pending.append((game, futures, pgn_file.tell()))
+                    in_flight += len(futures)
+                    continue
+                # Games are written in input order as soon as the oldest one is done.
+                game, futures, offset = pending.popleft()
+                results = [future.result() if future else None for future in futures]
+                in_flight -= len(futures)
+                rows = annotate_game(game, results)
+                write_game(output, output_format, games, game, rows)
+                games += 1
+                positions += sum(1 for result in results if result)
+                nodes += sum(result[2] for result in results if result)
+                if checkpoint_path:
+                    output.flush()
+                    save_checkpoint(checkpoint_path, options, games, offset, output.tell())
+                if time.perf_counter() - last_report >= 1:
+                    last_report = time.perf_counter()
+                    report_progress(games, positions, nodes, started, offset, total_bytes)
+    finally:
+        output.close()
+    report_progress(games, positions, nodes, started, offset, total_bytes, final=True)
+    return games, positions
+
+def main():
+    parser = argparse.ArgumentParser(description="Annotate every position of a PGN file with minimax scores.")
+    parser.add_argument("input", help="PGN file, read one game at a time")
+    parser.add_argument("output", help="annotated PGN or JSON lines output")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--time", type=int, help="search each position for this many milliseconds instead of a fixed depth")
+    parser.add_argument("--eval", type=int, choices=[1, 2, 3], default=1)
+    parser.add_argument("--format", choices=["pgn", "jsonl"], help="output format, guessed from the output extension by default")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--checkpoint", help="record progress here after every game")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint instead of starting over")
+    args = parser.parse_args()
+
+    output_format = args.format or ("jsonl" if args.output.endswith((".jsonl", ".json")) else "pgn")
+    options = {"depth": args.depth, "time": args.time, "eval": args.eval, "format": output_format}
+    run_analysis(args.input, args.output, options, args.workers, args.checkpoint, args.resume)
+
+if __name__ == "__main__":
+    main()
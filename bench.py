@@ -0,0 +1,168 @@
+import argparse
+import json
+import sys
+import time
+import chess
+import engine
+import searchboard
+
+bench_positions = [
+    ("opening", "start", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"),
+    ("opening", "italian", "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3"),
+    ("middlegame", "giuoco", "r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 7"),
+    ("middlegame", "kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"),
+    ("endgame", "rook", "8/5pk1/6p1/8/3R4/6P1/5PKP/3r4 b - - 0 40"),
+    ("endgame", "pawns", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"),
+    ("tactical", "legal", "r2qkb1r/pp2nppp/3p4/2pNN1B1/2BnP3/3P4/PPP2PPP/R2bK2R w KQkq - 1 10"),
+    ("tactical", "backrank", "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1"),
+]
+
+def load_epd(path):
+    positions = []
+    with open(path) as epd_file:
+        for number, line in enumerate(epd_file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            board, operations = chess.Board.from_epd(line)
+            positions.append(("epd", operations.get("id", f"{path}:{number}"), board.fen()))
+    return positions
+
+def perft(board, depth):
+    if depth == 0:
+        return 1
+    if depth == 1:
+        return board.legal_moves.count()
+    nodes = 0
+    for move in board.generate_legal_moves():
+        board.push(move)
+        nodes += perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+def run_search_bench(positions, depths, eval_choices, timing=False):
+    results = []
+    for category, name, fen in positions:
+        for depth in depths:
+            for eval_choice in eval_choices:
+                board = chess.Board(fen)
+                engine.new_game()
+                move, stats = engine.search_with_stats(board, depth, eval_choice=eval_choice, timing=timing)
+                row = {"category": category, "name": name, "fen": fen, "depth": depth, "eval": f"E{eval_choice}"}
+                row.update(stats.to_dict())
+                results.append(row)
+                print(f"{category:<10} {name:<10} d{depth} {row['eval']}  {str(row['move']):<6} {str(row['score']):>8} {row['nodes']:>9} nodes {row['quiescence_nodes']:>8} qnodes {row['time']:8.3f}s {row['nps']:>9.0f} nps  bf {row['branching_factor']:.1f}", flush=True)
+    return results
+
+def run_worker_bench(positions, depths, eval_choices, worker_counts):
+    # Times each search with every worker count, from fresh tables and a
+    # fresh pool, relative to the first count.
+    results = []
+    for category, name, fen in positions:
+        for depth in depths:
+            for eval_choice in eval_choices:
+                base_time = None
+                for workers in worker_counts:
+                    engine.shutdown_search_pool()
+                    engine.new_game()
+                    engine.search_workers = workers
+                    move, stats = engine.search_with_stats(chess.Board(fen), depth, eval_choice=eval_choice)
+                    if base_time is None:
+                        base_time = stats.time
+                    row = {"category": category, "name": name, "fen": fen, "depth": depth, "eval": f"E{eval_choice}", "workers": workers}
+                    row.update(stats.to_dict())
+                    row["speedup"] = base_time / stats.time if stats.time > 0 else 0
+                    results.append(row)
+                    print(f"{category:<10} {name:<10} d{depth} {row['eval']}  {workers:>2} workers  {str(row['move']):<6} {row['time']:8.3f}s  speedup {row['speedup']:.2f}x", flush=True)
+    engine.shutdown_search_pool()
+    base_total = sum(row["time"] for row in results if row["workers"] == worker_counts[0])
+    for workers in worker_counts:
+        total = sum(row["time"] for row in results if row["workers"] == workers)
+        print(f"{workers:>2} workers: {total:.3f}s, speedup {base_total / total if total > 0 else 0:.2f}x")
+    return results
+
+def run_perft_bench(positions, depth, search_board=False):
+    results = []
+    for category, name, fen in positions:
+        board = chess.Board(fen)
+        start = time.perf_counter()
+        nodes = searchboard.perft(searchboard.SearchBoard(board), depth) if search_board else perft(board, depth)
+        elapsed = time.perf_counter() - start
+        results.append({"category": category, "name": name, "fen": fen, "depth": depth, "nodes": nodes, "time": elapsed, "nps": nodes / elapsed if elapsed > 0 else 0})
+        print(f"{category:<10} {name:<10} perft {depth} {nodes:>10} nodes {elapsed:8.3f}s {results[-1]['nps']:>9.0f} nps", flush=True)
+    return results
+
+def run_perft_check(positions, depth):
+    # The array board must count exactly the same move paths as python-chess.
+    mismatches = 0
+    for category, name, fen in positions:
+        board = chess.Board(fen)
+        expected = perft(board, depth)
+        nodes = searchboard.perft(searchboard.SearchBoard(board), depth)
+        status = "ok" if nodes == expected else "MISMATCH"
+        mismatches += nodes != expected
+        print(f"{category:<10} {name:<10} perft {depth} {nodes:>10} array {expected:>10} python-chess  {status}", flush=True)
+    return mismatches
+
+def summarize(results):
+    nodes = sum(row["nodes"] for row in results)
+    elapsed = sum(row["time"] for row in results)
+    totals = {"positions": len(results), "nodes": nodes, "time": elapsed, "nps": nodes / elapsed if elapsed > 0 else 0}
+    for counter in ("quiescence_nodes", "leaf_evaluations", "beta_cutoffs", "tt_hits", "movegen_time", "eval_time"):
+        if results and counter in results[0]:
+            totals[counter] = sum(row[counter] for row in results)
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the minimax search or python-chess move generation.")
+    parser.add_argument("--depths", type=int, nargs="+", default=[2, 3, 4])
+    parser.add_argument("--evals", type=int, nargs="+", choices=[1, 2, 3], default=[1, 2, 3])
+    parser.add_argument("--epd", help="read positions from an EPD file instead of the built-in set")
+    parser.add_argument("--backend", choices=["incremental", "bitboard", "numpy", "scan"], default=engine.eval_backend)
+    parser.add_argument("--no-ordering", action="store_true", help="search moves in generator order")
+    parser.add_argument("--null-move", action="store_true", help="enable null-move pruning")
+    parser.add_argument("--lmr", action="store_true", help="enable late move reductions")
+    parser.add_argument("--pvs", action="store_true", help="enable principal variation search")
+    parser.add_argument("--aspiration", action="store_true", help="enable root aspiration windows")
+    parser.add_argument("--selective", action="store_true", help="enable all of the selective search options")
+    parser.add_argument("--quiescence", action="store_true", help="search captures and promotions past the horizon")
+    parser.add_argument("--search-board", action="store_true", help="search and run perft on the array board instead of chess.Board")
+    parser.add_argument("--workers", type=int, nargs="+", metavar="COUNT", help="time root-parallel search with each worker count, e.g. --workers 1 2 4 8")
+    parser.add_argument("--timing", action="store_true", help="split search time into move generation and evaluation")
+    parser.add_argument("--perft", type=int, metavar="DEPTH", help="count legal move paths instead of searching")
+    parser.add_argument("--perft-check", type=int, metavar="DEPTH", help="compare array board perft counts with python-chess and fail on a mismatch")
+    parser.add_argument("--json", metavar="PATH", help="write results and totals as JSON")
+    args = parser.parse_args()
+
+    positions = load_epd(args.epd) if args.epd else bench_positions
+    engine.eval_backend = args.backend
+    engine.ordering_enabled = not args.no_ordering
+    engine.null_move_enabled = args.null_move or args.selective
+    engine.lmr_enabled = args.lmr or args.selective
+    engine.pvs_enabled = args.pvs or args.selective
+    engine.aspiration_enabled = args.aspiration or args.selective
+    engine.search_board_enabled = args.search_board
+    engine.quiescence_enabled = args.quiescence
+    if args.perft_check:
+        mismatches = run_perft_check(positions, args.perft_check)
+        print(f"{mismatches} mismatches in {len(positions)} positions")
+        sys.exit(1 if mismatches else 0)
+    if args.perft:
+        results = run_perft_bench(positions, args.perft, args.search_board)
+        settings = {"mode": "perft", "depth": args.perft, "search_board": args.search_board}
+    elif args.workers:
+        results = run_worker_bench(positions, args.depths, args.evals, args.workers)
+        settings = {"mode": "workers", "depths": args.depths, "evals": args.evals, "workers": args.workers, "backend": args.backend}
+    else:
+        results = run_search_bench(positions, args.depths, args.evals, args.timing)
+        settings = {"mode": "search", "depths": args.depths, "evals": args.evals, "backend": args.backend, "ordering": not args.no_ordering,
+                    "null_move": engine.null_move_enabled, "lmr": engine.lmr_enabled, "pvs": engine.pvs_enabled, "aspiration": engine.aspiration_enabled,
+                    "search_board": args.search_board, "quiescence": args.quiescence}
+    totals = summarize(results)
+    print(f"total: {totals['nodes']} nodes in {totals['time']:.3f}s, {totals['nps']:.0f} nps")
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"settings": settings, "results": results, "totals": totals}, json_file, indent=2)
+
+if __name__ == "__main__":
+    main()
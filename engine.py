@@ -0,0 +1,1467 @@
+import chess
+import chess.polyglot
+import random
+import sqlite3
+import time
+import searchboard
+
+tt_megabytes = 32
+search_workers = 1
+book_path = None
+book_max_ply = 16
+book_selection = "weighted"
+cache_path = None
+cache_max_entries = 1000000
+
+piece_values = {chess.PAWN: 100, chess.KNIGHT: 320, chess.BISHOP: 330, chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 20000}
+pawn_table = [
+     0,  0,  0,   0,   0,  0,  0,  0,
+     5, 10, 10, -20, -20, 10, 10,  5,
+     5, -5,-10,   0,   0,-10, -5,  5,
+     0,  0,  0,  20,  20,  0,  0,  0,
+     5,  5, 10,  25,  25, 10,  5,  5,
+    10, 10, 20,  30,  30, 20, 10, 10,
+    50, 50, 50,  50,  50, 50, 50, 50,
+     0,  0,  0,   0,   0,  0,  0,  0
+]
+knight_table = [
+    -50,-40,-30,-30,-30,-30,-40,-50,
+    -40,-20,  0,  0,  0,  0,-20,-40,
+    -30,  0, 10, 15, 15, 10,  0,-30,
+    -30,  5, 15, 20, 20, 15,  5,-30,
+    -30,  0, 15, 20, 20, 15,  0,-30,
+    -30,  5, 10, 15, 15, 10,  5,-30,
+    -40,-20,  0,  5,  5,  0,-20,-40,
+    -50,-40,-30,-30,-30,-30,-40,-50
+]
+bishop_table = [
+    -20,-10,-10,-10,-10,-10,-10,-20,
+    -10,  0,  0,  0,  0,  0,  0,-10,
+    -10,  0,  5, 10, 10,  5,  0,-10,
+    -10,  5,  5, 10, 10,  5,  5,-10,
+    -10,  0, 10, 10, 10, 10,  0,-10,
+    -10, 10, 10, 10, 10, 10, 10,-10,
+    -10,  5,  0,  0,  0,  0,  5,-10,
+    -20,-10,-10,-10,-10,-10,-10,-20
+]
+rook_table = [
+     0,  0,  0,  0,  0,  0,  0,  0,
+     5, 10, 10, 10, 10, 10, 10,  5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+    -5,  0,  0,  0,  0,  0,  0, -5,
+     0,  0,  0,  5,  5,  0,  0,  0
+]
+queen_table = [
+    -20,-10,-10, -5, -5,-10,-10,-20,
+    -10,  0,  0,  0,  0,  0,  0,-10,
+    -10,  0,  5,  5,  5,  5,  0,-10,
+     -5,  0,  5,  5,  5,  5,  0, -5,
+      0,  0,  5,  5,  5,  5,  0, -5,
+    -10,  5,  5,  5,  5,  5,  0,-10,
+    -10,  0,  5,  0,  0,  0,  0,-10,
+    -20,-10,-10, -5, -5,-10,-10,-20
+]
+king_table = [
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -30,-40,-40,-50,-50,-40,-40,-30,
+    -20,-30,-30,-40,-40,-30,-30,-20,
+    -10,-20,-20,-20,-20,-20,-20,-10,
+     20, 20,  0,  0,  0,  0, 20, 20,
+     20, 30, 10,  0,  0, 10, 30, 20
+]
+piece_square_tables = {chess.PAWN: pawn_table, chess.KNIGHT: knight_table, chess.BISHOP: bishop_table, chess.ROOK: rook_table, chess.QUEEN: queen_table, chess.KING: king_table }
+
+def square_value(piece_type, color, square):
+    table = piece_square_tables[piece_type]
+    return table[square] if color == chess.WHITE else table[chess.square_mirror(square)]
+
+def evaluate_board_1(board):
+    score = 0
+    for square in chess.SQUARES:
+        piece = board.piece_at(square)
+        if piece:
+            value = piece_values[piece.piece_type]
+            if piece.color == chess.WHITE:
+                score += value 
+            else:
+                score -= value 
+    return score
+
+def evaluate_board_2(board):
+    score = 0
+    if board.is_checkmate():
+        return 2000000
+    if board.is_check():
+        score += 50 if board.turn == chess.WHITE else -50
+    for square in chess.SQUARES:
+        piece = board.piece_at(square)
+        if piece:
+            value = piece_values[piece.piece_type]
+            if piece.color == chess.WHITE:
+                score += value 
+            else:
+                score -= value 
+    return score
+
+def evaluate_board_3(board):
+    score = 0
+    if board.is_checkmate():
+        return 2000000
+    if board.is_check():
+        score += 50 if board.turn == chess.WHITE else -50
+
+    for square in chess.SQUARES:
+        piece = board.piece_at(square)
+        if piece:
+            value = piece_values[piece.piece_type]
+            table = piece_square_tables[piece.piece_type]
+            if piece.color == chess.WHITE:
+                pos_value = table[square]
+            else:
+                pos_value = table[chess.square_mirror(square)]
+            if piece.color == chess.WHITE:
+                score += value + pos_value
+            else:
+                score -= value + pos_value
+    return score
+
+full_evaluators = {1: evaluate_board_1, 2: evaluate_board_2, 3: evaluate_board_3}
+color_square_tables = {
+    chess.WHITE: [None] + [piece_square_tables[piece_type] for piece_type in chess.PIECE_TYPES],
+    chess.BLACK: [None] + [[piece_square_tables[piece_type][chess.square_mirror(square)] for square in chess.SQUARES] for piece_type in chess.PIECE_TYPES],
+}
+
+def evaluate_board_bitboard(board, eval_choice):
+    # Same scores as E1/E2/E3, including their flat 2000000 for checkmate.
+    in_check = eval_choice != 1 and board.is_check()
+    if in_check and board.is_checkmate():
+        return 2000000
+    white = board.occupied_co[chess.WHITE]
+    black = board.occupied_co[chess.BLACK]
+    white_tables = color_square_tables[chess.WHITE]
+    black_tables = color_square_tables[chess.BLACK]
+    masks = (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings)
+    score = 0
+    for piece_type, mask in zip(chess.PIECE_TYPES, masks):
+        white_mask = mask & white
+        black_mask = mask & black
+        score += piece_values[piece_type] * (chess.popcount(white_mask) - chess.popcount(black_mask))
+        if eval_choice == 3:
+            table = white_tables[piece_type]
+            for square in chess.scan_forward(white_mask):
+                score += table[square]
+            table = black_tables[piece_type]
+            for square in chess.scan_forward(black_mask):
+                score -= table[square]
+    if in_check:
+        score += 50 if board.turn == chess.WHITE else -50
+    return score
+
+class IncrementalEvaluator:
+    def __init__(self, debug=False):
+        self.debug = debug
+        self.material = 0
+        self.positional = 0
+        self.stack = []
+
+    def reset(self, board):
+        self.material = 0
+        self.positional = 0
+        self.stack = []
+        for square, piece in board.piece_map().items():
+            sign = 1 if piece.color == chess.WHITE else -1
+            self.material += sign * piece_values[piece.piece_type]
+            self.positional += sign * square_value(piece.piece_type, piece.color, square)
+
+    def push(self, board, move):
+        self.stack.append((self.material, self.positional))
+        color = board.turn
+        piece_type = board.piece_type_at(move.from_square) if move else None
+        if piece_type is not None:
+            # Deltas are from the mover's point of view and flipped for black.
+            placed = move.promotion or piece_type
+            material = piece_values[placed] - piece_values[piece_type]
+            positional = square_value(placed, color, move.to_square) - square_value(piece_type, color, move.from_square)
+            if board.is_castling(move):
+                rank = chess.square_rank(move.from_square)
+                if chess.square_file(move.to_square) > chess.square_file(move.from_square):
+                    rook_from, rook_to = chess.square(7, rank), chess.square(5, rank)
+                else:
+                    rook_from, rook_to = chess.square(0, rank), chess.square(3, rank)
+                positional += square_value(chess.ROOK, color, rook_to) - square_value(chess.ROOK, color, rook_from)
+            else:
+                if board.is_en_passant(move):
+                    captured_square = move.to_square - 8 if color == chess.WHITE else move.to_square + 8
+                    captured = chess.PAWN
+                else:
+                    captured_square = move.to_square
+                    captured = board.piece_type_at(move.to_square)
+                if captured is not None:
+                    material += piece_values[captured]
+                    positional += square_value(captured, not color, captured_square)
+            if color == chess.WHITE:
+                self.material += material
+                self.positional += positional
+            else:
+                self.material -= material
+                self.positional -= positional
+        board.push(move)
+
+    def pop(self, board):
+        board.pop()
+        self.material, self.positional = self.stack.pop()
+
+    def score(self, board, eval_choice):
+        score = self.material
+        if eval_choice == 3:
+            score += self.positional
+        if eval_choice != 1 and board.is_check():
+            score += 50 if board.turn == chess.WHITE else -50
+        if self.debug:
+            assert score == full_evaluators[eval_choice](board), (board.fen(), score)
+        return score
+
+evaluator = IncrementalEvaluator()
+eval_backend = "incremental"
+
+def make_move(board, move):
+    if eval_backend == "incremental":
+        evaluator.push(board, move)
+    else:
+        board.push(move)
+
+def unmake_move(board):
+    if eval_backend == "incremental":
+        evaluator.pop(board)
+    else:
+        board.pop()
+
+def evaluate_leaf(board):
+    if eval_backend == "incremental":
+        return eval_sign * evaluator.score(board, eval_choice)
+    if eval_backend == "numpy" and frontier_score is not None:
+        score = frontier_score
+        if eval_choice != 1 and board.is_check():
+            score += 50 if board.turn == chess.WHITE else -50
+        return eval_sign * score
+    if eval_backend in ("bitboard", "numpy"):
+        return eval_sign * evaluate_board_bitboard(board, eval_choice)
+    return eval_sign * full_evaluators[eval_choice](board)
+
+# Batched leaf evaluation: nodes one ply above the leaves write every child
+# position into a reused (N, 64) buffer of piece codes (piece type, +6 for
+# black) and score them all with one lookup into a (13, 64) table. The
+# leaves then only add the check bonus.
+numpy = None
+batch_squares = None
+batch_tables = None
+leaf_buffer = None
+
+def load_batch_tables():
+    # NumPy is imported the first time the numpy backend searches, so
+    # importing the engine stays cheap for every other backend.
+    global numpy, batch_squares, batch_tables
+    if batch_tables is not None:
+        return True
+    try:
+        import numpy
+    except ImportError:
+        return False
+    batch_squares = numpy.arange(64)
+    tables = {}
+    for choice in (1, 2, 3):
+        table = numpy.zeros((13, 64), dtype=numpy.int32)
+        for piece_type in chess.PIECE_TYPES:
+            for square in chess.SQUARES:
+                table[piece_type, square] = piece_values[piece_type]
+                table[piece_type + 6, square] = -piece_values[piece_type]
+                if choice == 3:
+                    table[piece_type, square] += square_value(piece_type, chess.WHITE, square)
+                    table[piece_type + 6, square] -= square_value(piece_type, chess.BLACK, square)
+        tables[choice] = table
+    batch_tables = tables
+    return True
+frontier_score = None
+
+def placement_codes(board):
+    codes = [0] * 64
+    white = board.occupied_co[chess.WHITE]
+    masks = (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings)
+    for piece_type, mask in zip(chess.PIECE_TYPES, masks):
+        for square in chess.scan_forward(mask):
+            codes[square] = piece_type if white & chess.BB_SQUARES[square] else piece_type + 6
+    return codes
+
+def batch_evaluate(board, moves):
+    global leaf_buffer
+    count = len(moves)
+    if leaf_buffer is None or len(leaf_buffer) < count:
+        leaf_buffer = numpy.zeros((max(count, 64), 64), dtype=numpy.int8)
+    children = leaf_buffer[:count]
+    parent = placement_codes(board)
+    children[:] = parent
+    offset = 0 if board.turn == chess.WHITE else 6
+    clear_rows, clear_squares = [], []
+    set_rows, set_squares, set_codes = [], [], []
+    for row, move in enumerate(moves):
+        piece = parent[move.from_square]
+        clear_rows.append(row)
+        clear_squares.append(move.from_square)
+        if board.is_castling(move):
+            rank = chess.square_rank(move.from_square)
+            if chess.square_file(move.to_square) > chess.square_file(move.from_square):
+                rook_from, king_to, rook_to = chess.square(7, rank), chess.square(6, rank), chess.square(5, rank)
+            else:
+                rook_from, king_to, rook_to = chess.square(0, rank), chess.square(2, rank), chess.square(3, rank)
+            clear_rows.append(row)
+            clear_squares.append(rook_from)
+            set_rows += (row, row)
+            set_squares += (king_to, rook_to)
+            set_codes += (piece, chess.ROOK + offset)
+            continue
+        if move.to_square == board.ep_square and piece == chess.PAWN + offset:
+            clear_rows.append(row)
+            clear_squares.append(move.to_square - 8 if board.turn == chess.WHITE else move.to_square + 8)
+        set_rows.append(row)
+        set_squares.append(move.to_square)
+        set_codes.append(move.promotion + offset if move.promotion else piece)
+    children[clear_rows, clear_squares] = 0
+    children[set_rows, set_squares] = set_codes
+    return batch_tables[eval_choice][children, batch_squares].sum(axis=1).tolist()
+
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2
+TT_ENTRY_BYTES = 128
+
+class TranspositionTable:
+    def __init__(self, max_entries=None, megabytes=16):
+        if max_entries is None:
+            max_entries = megabytes * 1024 * 1024 // TT_ENTRY_BYTES
+        self.bucket_count = max(1, max_entries // 2)
+        self.clear()
+
+    def clear(self):
+        # Each bucket has a depth-preferred slot and an always-replace slot.
+        self.depth_slots = [None] * self.bucket_count
+        self.always_slots = [None] * self.bucket_count
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def probe(self, key):
+        index = key % self.bucket_count
+        occupied = False
+        for entry in (self.depth_slots[index], self.always_slots[index]):
+            if entry is not None:
+                if entry[0] == key:
+                    self.hits += 1
+                    return entry
+                occupied = True
+        self.misses += 1
+        if occupied:
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        index = key % self.bucket_count
+        current = self.depth_slots[index]
+        if move is None:
+            for entry in (current, self.always_slots[index]):
+                if entry is not None and entry[0] == key:
+                    move = entry[4]
+                    break
+        entry = (key, depth, score, flag, move)
+        if current is None or current[0] == key or depth >= current[1]:
+            self.depth_slots[index] = entry
+        else:
+            self.always_slots[index] = entry
+
+    def counters(self):
+        return {"hits": self.hits, "misses": self.misses, "collisions": self.collisions}
+
+transposition_table = TranspositionTable(megabytes=tt_megabytes)
+salt_rng = random.Random(0x5EED)
+search_salts = {(side, choice): salt_rng.getrandbits(64) for side in chess.COLORS for choice in (1, 2, 3)}
+search_salt = 0
+
+def salt_for(turn, choice):
+    # Options that change scores get keys of their own, so neither the
+    # table nor the position cache answers a search with another
+    # configuration's results. The salt is seeded, so it matches across
+    # processes.
+    salt = search_salts[(turn, choice)]
+    if null_move_enabled or lmr_enabled or pvs_enabled or quiescence_enabled:
+        options = (null_move_enabled, null_move_reduction, lmr_enabled, pvs_enabled, quiescence_enabled, delta_margin)
+        salt ^= random.Random(hash(options)).getrandbits(64)
+    return salt
+
+eval_choice = 1
+eval_sign = 1
+search_nodes = 0
+quiescence_nodes = 0
+search_deadline = None
+stop_requested = False
+last_score = 0
+# False when stop_search() cut a parallel search short of its full depth.
+last_search_complete = True
+MAX_SEARCH_DEPTH = 32
+MATE_SCORE = 2000000
+
+ordering_enabled = True
+# Selective search, all off by default so plain alpha-beta stays the baseline.
+null_move_enabled = False
+null_move_reduction = 2
+lmr_enabled = False
+pvs_enabled = False
+aspiration_enabled = False
+aspiration_window = 50
+# Quiescence: leaves keep searching captures and promotions until quiet.
+quiescence_enabled = False
+delta_margin = 200
+# Search on the array board from searchboard.py instead of chess.Board.
+search_board_enabled = False
+killer_moves = [[None, None] for _ in range(MAX_SEARCH_DEPTH + 1)]
+history_scores = [[[0] * 64 for _ in range(64)] for _ in chess.COLORS]
+
+class SearchTimeout(Exception):
+    pass
+
+class SearchStats:
+    def __init__(self, timing=False):
+        self.timing = timing
+        self.start_nodes = search_nodes
+        self.start_quiescence = quiescence_nodes
+        self.start_time = time.perf_counter()
+        self.start_tt = transposition_table.counters()
+        self.finished = False
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.leaf_evaluations = 0
+        self.interior_nodes = 0
+        self.moves_generated = 0
+        self.moves_searched = 0
+        self.beta_cutoffs = 0
+        self.cutoff_move_index = {}
+        self.tt_cutoffs = 0
+        self.tt_hits = 0
+        self.tt_misses = 0
+        self.movegen_time = 0.0
+        self.eval_time = 0.0
+        self.time = 0.0
+        self.depth = 0
+        self.move = None
+        self.score = None
+        self.book = False
+        self.cached = False
+
+    def evaluate(self, board):
+        self.leaf_evaluations += 1
+        if not self.timing:
+            return evaluate_leaf(board)
+        started = time.perf_counter()
+        score = evaluate_leaf(board)
+        self.eval_time += time.perf_counter() - started
+        return score
+
+    def count_cutoff(self, index):
+        self.beta_cutoffs += 1
+        self.cutoff_move_index[index] = self.cutoff_move_index.get(index, 0) + 1
+
+    def node_count(self):
+        return self.nodes if self.finished else search_nodes - self.start_nodes
+
+    def elapsed(self):
+        return self.time if self.finished else time.perf_counter() - self.start_time
+
+    def nps(self):
+        elapsed = self.elapsed()
+        return self.node_count() / elapsed if elapsed > 0 else 0
+
+    def branching_factor(self):
+        # Children actually searched per interior node, after pruning.
+        return self.moves_searched / self.interior_nodes if self.interior_nodes else 0
+
+    def legal_branching_factor(self):
+        return self.moves_generated / self.interior_nodes if self.interior_nodes else 0
+
+    def first_move_cutoff_rate(self):
+        return self.cutoff_move_index.get(0, 0) / self.beta_cutoffs if self.beta_cutoffs else 0
+
+    def finish(self, move, depth):
+        counters = transposition_table.counters()
+        self.nodes = search_nodes - self.start_nodes
+        self.quiescence_nodes = quiescence_nodes - self.start_quiescence
+        self.time = time.perf_counter() - self.start_time
+        self.tt_hits += counters["hits"] - self.start_tt["hits"]
+        self.tt_misses += counters["misses"] - self.start_tt["misses"]
+        self.move = move
+        self.depth = depth
+        # From the side to move's point of view, unlike the search's own scores.
+        self.score = -last_score if move is not None else None
+        self.finished = True
+
+    def merge(self, worker):
+        # Adds in the counters of a root move searched in a pool worker; its
+        # nodes are already counted through search_nodes.
+        self.leaf_evaluations += worker.leaf_evaluations
+        self.interior_nodes += worker.interior_nodes
+        self.moves_generated += worker.moves_generated
+        self.moves_searched += worker.moves_searched
+        self.beta_cutoffs += worker.beta_cutoffs
+        for index, count in worker.cutoff_move_index.items():
+            self.cutoff_move_index[index] = self.cutoff_move_index.get(index, 0) + count
+        self.tt_cutoffs += worker.tt_cutoffs
+        self.tt_hits += worker.tt_hits
+        self.tt_misses += worker.tt_misses
+        self.movegen_time += worker.movegen_time
+        self.eval_time += worker.eval_time
+
+    def to_dict(self):
+        return {
+            "move": self.move.uci() if self.move else None,
+            "book": self.book,
+            "cached": self.cached,
+            "score": self.score,
+            "depth": self.depth,
+            "nodes": self.node_count(),
+            "time": self.elapsed(),
+            "nps": self.nps(),
+            "quiescence_nodes": self.quiescence_nodes if self.finished else quiescence_nodes - self.start_quiescence,
+            "leaf_evaluations": self.leaf_evaluations,
+            "interior_nodes": self.interior_nodes,
+            "branching_factor": self.branching_factor(),
+            "legal_branching_factor": self.legal_branching_factor(),
+            "beta_cutoffs": self.beta_cutoffs,
+            "first_move_cutoff_rate": self.first_move_cutoff_rate(),
+            "cutoff_move_index": {str(index): count for index, count in sorted(self.cutoff_move_index.items())},
+            "tt_cutoffs": self.tt_cutoffs,
+            "tt_hits": self.tt_hits,
+            "tt_misses": self.tt_misses,
+            "movegen_time": self.movegen_time,
+            "eval_time": self.eval_time,
+        }
+
+search_stats = None
+
+def order_moves(board, moves, ply, tt_move=None):
+    if not ordering_enabled:
+        return moves
+    killers = killer_moves[ply] if ply < len(killer_moves) else (None, None)
+    history = history_scores[board.turn]
+
+    def move_priority(move):
+        if move == tt_move:
+            return 3000000000
+        if board.is_capture(move):
+            # MVV-LVA: most valuable victim first, cheapest attacker breaks ties.
+            victim = chess.PAWN if board.is_en_passant(move) else board.piece_type_at(move.to_square)
+            attacker = board.piece_type_at(move.from_square)
+            return 2000000000 + victim * 10 - attacker + (move.promotion or 0) * 100
+        if move.promotion:
+            return 2000000000 + move.promotion * 100
+        if move == killers[0]:
+            return 1000000001
+        if move == killers[1]:
+            return 1000000000
+        return history[move.from_square][move.to_square]
+
+    return sorted(moves, key=move_priority, reverse=True)
+
+def record_cutoff(board, move, depth, ply):
+    if board.is_capture(move) or move.promotion:
+        return
+    record_cutoff_quiet(board.turn, move, depth, ply)
+
+def record_cutoff_quiet(turn, move, depth, ply):
+    if ply < len(killer_moves):
+        killers = killer_moves[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+    history = history_scores[turn]
+    history[move.from_square][move.to_square] += depth * depth
+
+def reset_move_ordering():
+    for killers in killer_moves:
+        killers[0] = killers[1] = None
+    for side in history_scores:
+        for row in side:
+            row[:] = [0] * 64
+
+def age_history():
+    for side in history_scores:
+        for row in side:
+            row[:] = [value // 2 for value in row]
+
+position_keys = []
+
+def history_keys(board):
+    # Zobrist keys of the positions since the last irreversible move, oldest first.
+    keys = []
+    replay = board.copy()
+    while replay.move_stack and len(keys) < board.halfmove_clock:
+        replay.pop()
+        keys.append(chess.polyglot.zobrist_hash(replay))
+    keys.reverse()
+    return keys
+
+def is_repetition(board, key):
+    # Threefold: the current position plus two earlier occurrences since the
+    # last capture or pawn move, which takes at least eight plies.
+    plies = board.halfmove_clock
+    if plies < 8:
+        return False
+    return position_keys[-plies:].count(key) >= 2
+
+def has_non_pawn_material(board):
+    # Null moves are unsafe in king and pawn endings, where zugzwang is common.
+    return bool(board.occupied_co[board.turn] & ~(board.pawns | board.kings))
+
+def late_move_reduction(board, move, depth, index, in_check):
+    # Quiet moves ordered late are first searched one ply shallower.
+    if depth < 3 or index < 3 or in_check or move.promotion or board.is_capture(move) or board.gives_check(move):
+        return 0
+    return 1
+
+def minimax(board, depth, alpha, beta, maximizing, ply=1):
+    global search_nodes, frontier_score
+    search_nodes += 1
+    if search_deadline is not None and search_nodes % 64 == 0 and search_interrupted():
+        raise SearchTimeout()
+    stats = search_stats
+    if stats is not None and stats.timing:
+        started = time.perf_counter()
+    # Legal moves are generated once: no moves means mate or stalemate. Leaves
+    # only need to know whether any move exists.
+    if depth == 0:
+        legal_moves = None
+        has_moves = any(board.generate_legal_moves())
+    else:
+        legal_moves = list(board.generate_legal_moves())
+        has_moves = bool(legal_moves)
+    if stats is not None and stats.timing:
+        stats.movegen_time += time.perf_counter() - started
+    if not has_moves:
+        if board.is_check():
+            return -MATE_SCORE if maximizing else MATE_SCORE
+        return 0
+    if board.is_insufficient_material():
+        return 0
+    if depth == 0:
+        # Leaves skip hashing unless a repetition is possible at all.
+        if board.halfmove_clock >= 8 and is_repetition(board, chess.polyglot.zobrist_hash(board)):
+            return 0
+        if quiescence_enabled:
+            return quiescence(board, alpha, beta, maximizing)
+        if stats is not None:
+            return stats.evaluate(board)
+        return evaluate_leaf(board)
+    position_key = chess.polyglot.zobrist_hash(board)
+    if is_repetition(board, position_key):
+        return 0
+
+    key = position_key ^ search_salt
+    entry = transposition_table.probe(key)
+    tt_move = None
+    if entry is not None:
+        tt_move = entry[4]
+        if entry[1] >= depth:
+            score, flag = entry[2], entry[3]
+            if flag == TT_EXACT or (flag == TT_LOWER and score >= beta) or (flag == TT_UPPER and score <= alpha):
+                if stats is not None:
+                    stats.tt_cutoffs += 1
+                return score
+    alpha_orig, beta_orig = alpha, beta
+    best_move = None
+    in_check = (null_move_enabled or lmr_enabled) and board.is_check()
+
+    # Null move: if passing still fails high, a real move would too.
+    if null_move_enabled and depth >= 3 and not in_check and not (board.move_stack and not board.peek()) and has_non_pawn_material(board):
+        if maximizing and beta != float('inf'):
+            make_move(board, chess.Move.null())
+            null_score = minimax(board, depth - 1 - null_move_reduction, beta - 1, beta, False, ply + 1)
+            unmake_move(board)
+            if null_score >= beta:
+                return beta
+        elif not maximizing and alpha != float('-inf'):
+            make_move(board, chess.Move.null())
+            null_score = minimax(board, depth - 1 - null_move_reduction, alpha, alpha + 1, True, ply + 1)
+            unmake_move(board)
+            if null_score <= alpha:
+                return alpha
+
+    legal_moves = order_moves(board, legal_moves, ply, tt_move)
+    if stats is not None:
+        stats.interior_nodes += 1
+        stats.moves_generated += len(legal_moves)
+    leaf_scores = None
+    if depth == 1 and eval_backend == "numpy" and batch_tables is not None:
+        if stats is not None and stats.timing:
+            started = time.perf_counter()
+        leaf_scores = batch_evaluate(board, legal_moves)
+        if stats is not None and stats.timing:
+            stats.eval_time += time.perf_counter() - started
+    position_keys.append(position_key)
+    if maximizing:
+        max_eval = float('-inf')
+        for index, move in enumerate(legal_moves):
+            reduction = late_move_reduction(board, move, depth, index, in_check) if lmr_enabled else 0
+            make_move(board, move)
+            if leaf_scores is not None:
+                frontier_score = leaf_scores[index]
+            if index > 0 and (pvs_enabled or reduction) and alpha != float('-inf'):
+                # Zero-window probe, reduced for late quiet moves, re-searched
+                # only when the move might raise alpha.
+                eval_score = minimax(board, depth - 1 - reduction, alpha, alpha + 1, False, ply + 1)
+                if eval_score > alpha and reduction:
+                    eval_score = minimax(board, depth - 1, alpha, alpha + 1 if pvs_enabled else beta, False, ply + 1)
+                if pvs_enabled and alpha < eval_score < beta:
+                    eval_score = minimax(board, depth - 1, alpha, beta, False, ply + 1)
+            else:
+                eval_score = minimax(board, depth - 1, alpha, beta, False, ply + 1)
+            unmake_move(board)
+            frontier_score = None
+            if eval_score > max_eval:
+                max_eval = eval_score
+                best_move = move
+            if max_eval >= beta:
+                record_cutoff(board, move, depth, ply)
+                if stats is not None:
+                    stats.count_cutoff(index)
+                    stats.moves_searched += index + 1
+                position_keys.pop()
+                transposition_table.store(key, depth, max_eval, TT_LOWER, best_move)
+                return max_eval
+            alpha = max(alpha, eval_score)
+        if stats is not None:
+            stats.moves_searched += len(legal_moves)
+        position_keys.pop()
+        flag = TT_UPPER if max_eval <= alpha_orig else TT_EXACT
+        transposition_table.store(key, depth, max_eval, flag, best_move)
+        return max_eval
+    else:
+        min_eval = float('inf')
+        for index, move in enumerate(legal_moves):
+            reduction = late_move_reduction(board, move, depth, index, in_check) if lmr_enabled else 0
+            make_move(board, move)
+            if leaf_scores is not None:
+                frontier_score = leaf_scores[index]
+            if index > 0 and (pvs_enabled or reduction) and beta != float('inf'):
+                eval_score = minimax(board, depth - 1 - reduction, beta - 1, beta, True, ply + 1)
+                if eval_score < beta and reduction:
+                    eval_score = minimax(board, depth - 1, beta - 1 if pvs_enabled else alpha, beta, True, ply + 1)
+                if pvs_enabled and alpha < eval_score < beta:
+                    eval_score = minimax(board, depth - 1, alpha, beta, True, ply + 1)
+            else:
+                eval_score = minimax(board, depth - 1, alpha, beta, True, ply + 1)
+            unmake_move(board)
+            frontier_score = None
+            if eval_score < min_eval:
+                min_eval = eval_score
+                best_move = move
+            if min_eval <= alpha:
+                record_cutoff(board, move, depth, ply)
+                if stats is not None:
+                    stats.count_cutoff(index)
+                    stats.moves_searched += index + 1
+                position_keys.pop()
+                transposition_table.store(key, depth, min_eval, TT_UPPER, best_move)
+                return min_eval
+            beta = min(beta, eval_score)
+        if stats is not None:
+            stats.moves_searched += len(legal_moves)
+        position_keys.pop()
+        flag = TT_LOWER if min_eval >= beta_orig else TT_EXACT
+        transposition_table.store(key, depth, min_eval, flag, best_move)
+        return min_eval
+
+def quiescence_moves(board):
+    # Captures and promotions only, MVV-LVA ordered, each with the material
+    # it wins for delta pruning.
+    moves = list(board.generate_legal_captures())
+    moves += [move for move in board.generate_legal_moves(board.pawns, chess.BB_BACKRANKS & ~board.occupied) if move.promotion]
+    scored = []
+    for move in moves:
+        victim = chess.PAWN if board.is_en_passant(move) else board.piece_type_at(move.to_square)
+        attacker = board.piece_type_at(move.from_square)
+        gain = piece_values[victim] if victim else 0
+        if move.promotion:
+            gain += piece_values[move.promotion] - piece_values[chess.PAWN]
+        scored.append(((victim or 0) * 10 - attacker + (move.promotion or 0) * 100, gain, move))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [(gain, move) for _, gain, move in scored]
+
+def quiescence(board, alpha, beta, maximizing):
+    global search_nodes, quiescence_nodes, frontier_score
+    stats = search_stats
+    in_check = board.is_check()
+    if in_check:
+        # No standing pat in check: every evasion is searched, and having
+        # none is mate.
+        frontier_score = None
+        moves = [(0, move) for move in board.generate_legal_moves()]
+        if not moves:
+            return -MATE_SCORE if maximizing else MATE_SCORE
+        best = float('-inf') if maximizing else float('inf')
+    else:
+        # Stand pat: the side to move can always decline to capture.
+        stand_pat = stats.evaluate(board) if stats is not None else evaluate_leaf(board)
+        frontier_score = None
+        if maximizing:
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+        else:
+            if stand_pat <= alpha:
+                return stand_pat
+            beta = min(beta, stand_pat)
+        best = stand_pat
+        moves = quiescence_moves(board)
+    for gain, move in moves:
+        # Delta pruning: skip captures that cannot reach the window even with
+        # a positional margin on top of the material won.
+        if not in_check and ((stand_pat + gain + delta_margin <= alpha) if maximizing else (stand_pat - gain - delta_margin >= beta)):
+            continue
+        search_nodes += 1
+        quiescence_nodes += 1
+        if search_deadline is not None and search_nodes % 64 == 0 and search_interrupted():
+            raise SearchTimeout()
+        make_move(board, move)
+        score = quiescence(board, alpha, beta, not maximizing)
+        unmake_move(board)
+        if maximizing:
+            best = max(best, score)
+            if best >= beta:
+                return best
+            alpha = max(alpha, best)
+        else:
+            best = min(best, score)
+            if best <= alpha:
+                return best
+            beta = min(beta, best)
+    return best
+
+def prepare_search(board, choice):
+    global search_salt, eval_choice, eval_sign, frontier_score
+    # The side to move at the root is the minimizing side, so scores are
+    # kept from its opponent's point of view.
+    eval_choice = choice
+    eval_sign = -1 if board.turn == chess.WHITE else 1
+    search_salt = salt_for(board.turn, choice)
+    age_history()
+    if eval_backend == "incremental":
+        evaluator.reset(board)
+    elif eval_backend == "numpy":
+        load_batch_tables()
+    frontier_score = None
+    position_keys[:] = history_keys(board)
+    position_keys.append(chess.polyglot.zobrist_hash(board))
+    return position_keys[-1] ^ search_salt
+
+first_iteration_deadline = None
+root_best = None
+
+def record_root_best(move, score):
+    # The first iteration runs without a deadline until one root move has a
+    # score, then stops like any other, falling back on that move.
+    global root_best, search_deadline, first_iteration_deadline
+    root_best = (move, score)
+    if first_iteration_deadline is not None:
+        search_deadline = first_iteration_deadline
+        first_iteration_deadline = None
+
+def search_root(board, legal_moves, depth, alpha, beta):
+    best_move = None
+    min_eval = float('inf')
+    for move in legal_moves:
+        make_move(board, move)
+        if board.is_checkmate():
+            unmake_move(board)
+            return move, -MATE_SCORE
+        eval_score = minimax(board, depth - 1, alpha, beta, True)
+        unmake_move(board)
+        if eval_score < min_eval:
+            min_eval = eval_score
+            best_move = move
+            beta = min(beta, min_eval)
+            record_root_best(move, min_eval)
+    return best_move, min_eval
+
+def get_best_move(board, depth, eval_choice=1):
+    global last_score
+    if search_board_enabled and not (null_move_enabled or lmr_enabled or pvs_enabled or aspiration_enabled or quiescence_enabled):
+        return get_best_move_array(board, depth, eval_choice)
+    root_key = prepare_search(board, eval_choice)
+    entry = transposition_table.probe(root_key)
+    legal_moves = order_moves(board, list(board.legal_moves), 0, entry[4] if entry else None)
+    if aspiration_enabled and entry is not None and entry[3] == TT_EXACT and abs(entry[2]) < MATE_SCORE:
+        # Aspiration window around the previous iteration's score; a result
+        # on or outside either edge is only a bound, so search again in full.
+        alpha, beta = entry[2] - aspiration_window, entry[2] + aspiration_window
+        best_move, min_eval = search_root(board, legal_moves, depth, alpha, beta)
+        if min_eval != -MATE_SCORE and (min_eval <= alpha or min_eval >= beta):
+            best_move, min_eval = search_root(board, legal_moves, depth, float('-inf'), float('inf'))
+    else:
+        best_move, min_eval = search_root(board, legal_moves, depth, float('-inf'), float('inf'))
+    if best_move is not None:
+        transposition_table.store(root_key, depth, min_eval, TT_EXACT, best_move)
+        last_score = min_eval
+    return best_move
+
+array_material, array_positional = searchboard.build_score_tables(piece_values, square_value)
+square_64s = [searchboard.square_64(square) for square in range(128)]
+
+def order_array_moves(board, moves, ply, tt_move=None):
+    if not ordering_enabled:
+        return moves
+    killers = killer_moves[ply] if ply < len(killer_moves) else (None, None)
+    first_killer = searchboard.from_chess_move(killers[0]) if killers[0] else None
+    second_killer = searchboard.from_chess_move(killers[1]) if killers[1] else None
+    history = history_scores[board.turn]
+    squares = board.squares
+
+    def move_priority(move):
+        if move == tt_move:
+            return 3000000000
+        promotion = move >> 14
+        victim = board.captured_piece_type(move)
+        if victim:
+            return 2000000000 + victim * 10 - (squares[move & 127] & 7) + promotion * 100
+        if promotion:
+            return 2000000000 + promotion * 100
+        if move == first_killer:
+            return 1000000001
+        if move == second_killer:
+            return 1000000000
+        return history[square_64s[move & 127]][square_64s[(move >> 7) & 127]]
+
+    return sorted(moves, key=move_priority, reverse=True)
+
+def record_array_cutoff(board, move, depth, ply):
+    if move >> 14 or board.is_capture(move):
+        return
+    record_cutoff_quiet(board.turn, searchboard.to_chess_move(move), depth, ply)
+
+def evaluate_array(board):
+    score = board.material
+    if eval_choice == 3:
+        score += board.positional
+    if eval_choice != 1 and board.is_check():
+        score += 50 if board.turn == chess.WHITE else -50
+    return eval_sign * score
+
+def minimax_array(board, depth, alpha, beta, maximizing, ply=1):
+    # minimax() on a searchboard.SearchBoard, without the selective options.
+    global search_nodes
+    search_nodes += 1
+    if search_deadline is not None and search_nodes % 64 == 0 and search_interrupted():
+        raise SearchTimeout()
+    stats = search_stats
+    if stats is not None and stats.timing:
+        started = time.perf_counter()
+    if depth == 0:
+        legal_moves = None
+        has_moves = board.has_legal_move()
+    else:
+        legal_moves = board.generate_legal_moves()
+        has_moves = bool(legal_moves)
+    if stats is not None and stats.timing:
+        stats.movegen_time += time.perf_counter() - started
+    if not has_moves:
+        if board.is_check():
+            return -MATE_SCORE if maximizing else MATE_SCORE
+        return 0
+    if board.is_insufficient_material():
+        return 0
+    if depth == 0:
+        if board.halfmove_clock >= 8 and is_repetition(board, board.hash):
+            return 0
+        if stats is not None:
+            stats.leaf_evaluations += 1
+            if stats.timing:
+                started = time.perf_counter()
+                score = evaluate_array(board)
+                stats.eval_time += time.perf_counter() - started
+                return score
+        return evaluate_array(board)
+    position_key = board.hash
+    if is_repetition(board, position_key):
+        return 0
+
+    key = position_key ^ search_salt
+    entry = transposition_table.probe(key)
+    tt_move = None
+    if entry is not None:
+        tt_move = searchboard.from_chess_move(entry[4]) if entry[4] else None
+        if entry[1] >= depth:
+            score, flag = entry[2], entry[3]
+            if flag == TT_EXACT or (flag == TT_LOWER and score >= beta) or (flag == TT_UPPER and score <= alpha):
+                if stats is not None:
+                    stats.tt_cutoffs += 1
+                return score
+    alpha_orig, beta_orig = alpha, beta
+    best_move = None
+
+    legal_moves = order_array_moves(board, legal_moves, ply, tt_move)
+    if stats is not None:
+        stats.interior_nodes += 1
+        stats.moves_generated += len(legal_moves)
+    position_keys.append(position_key)
+    if maximizing:
+        max_eval = float('-inf')
+        for index, move in enumerate(legal_moves):
+            board.push(move)
+            eval_score = minimax_array(board, depth - 1, alpha, beta, False, ply + 1)
+            board.pop()
+            if eval_score > max_eval:
+                max_eval = eval_score
+                best_move = move
+            if max_eval >= beta:
+                record_array_cutoff(board, move, depth, ply)
+                if stats is not None:
+                    stats.count_cutoff(index)
+                    stats.moves_searched += index + 1
+                position_keys.pop()
+                transposition_table.store(key, depth, max_eval, TT_LOWER, searchboard.to_chess_move(best_move))
+                return max_eval
+            alpha = max(alpha, eval_score)
+        if stats is not None:
+            stats.moves_searched += len(legal_moves)
+        position_keys.pop()
+        flag = TT_UPPER if max_eval <= alpha_orig else TT_EXACT
+        transposition_table.store(key, depth, max_eval, flag, searchboard.to_chess_move(best_move))
+        return max_eval
+    else:
+        min_eval = float('inf')
+        for index, move in enumerate(legal_moves):
+            board.push(move)
+            eval_score = minimax_array(board, depth - 1, alpha, beta, True, ply + 1)
+            board.pop()
+            if eval_score < min_eval:
+                min_eval = eval_score
+                best_move = move
+            if min_eval <= alpha:
+                record_array_cutoff(board, move, depth, ply)
+                if stats is not None:
+                    stats.count_cutoff(index)
+                    stats.moves_searched += index + 1
+                position_keys.pop()
+                transposition_table.store(key, depth, min_eval, TT_UPPER, searchboard.to_chess_move(best_move))
+                return min_eval
+            beta = min(beta, eval_score)
+        if stats is not None:
+            stats.moves_searched += len(legal_moves)
+        position_keys.pop()
+        flag = TT_LOWER if min_eval >= beta_orig else TT_EXACT
+        transposition_table.store(key, depth, min_eval, flag, searchboard.to_chess_move(best_move))
+        return min_eval
+
+def get_best_move_array(board, depth, eval_choice=1):
+    global last_score
+    root_key = prepare_search(board, eval_choice)
+    search_board = searchboard.SearchBoard(board, array_material, array_positional)
+    entry = transposition_table.probe(root_key)
+    tt_move = searchboard.from_chess_move(entry[4]) if entry and entry[4] else None
+    legal_moves = order_array_moves(search_board, search_board.generate_legal_moves(), 0, tt_move)
+    best_move = None
+    min_eval = float('inf')
+    beta = float('inf')
+    for move in legal_moves:
+        search_board.push(move)
+        if not search_board.has_legal_move() and search_board.is_check():
+            search_board.pop()
+            best_move = searchboard.to_chess_move(move)
+            transposition_table.store(root_key, depth, -MATE_SCORE, TT_EXACT, best_move)
+            last_score = -MATE_SCORE
+            return best_move
+        eval_score = minimax_array(search_board, depth - 1, float('-inf'), beta, True)
+        search_board.pop()
+        if eval_score < min_eval:
+            min_eval = eval_score
+            best_move = move
+            beta = min_eval
+            record_root_best(searchboard.to_chess_move(move), min_eval)
+    if best_move is None:
+        return None
+    best_move = searchboard.to_chess_move(best_move)
+    transposition_table.store(root_key, depth, min_eval, TT_EXACT, best_move)
+    last_score = min_eval
+    return best_move
+
+def principal_variation(board, max_length):
+    # Follows best moves stored in the transposition table for the current
+    # search configuration.
+    board = board.copy(stack=False)
+    line = []
+    while len(line) < max_length:
+        entry = transposition_table.probe(chess.polyglot.zobrist_hash(board) ^ search_salt)
+        if entry is None or entry[4] is None or not board.is_legal(entry[4]):
+            break
+        line.append(entry[4])
+        board.push(entry[4])
+    return line
+
+search_pool = None
+search_pool_workers = 0
+shared_root_bound = None
+search_stop = None
+shared_stop = None
+
+def init_search_worker(bound, stop):
+    global shared_root_bound, shared_stop, search_deadline
+    shared_root_bound = bound
+    shared_stop = stop
+    # No time limit, but the stop check in the search is switched on.
+    search_deadline = float('inf')
+
+def expected_reply(board, eval_choice=1):
+    # The reply the opponent's last search expected here, if it is still in
+    # the transposition table.
+    key = chess.polyglot.zobrist_hash(board) ^ salt_for(not board.turn, eval_choice)
+    entry = transposition_table.probe(key)
+    if entry is None or entry[4] is None or not board.is_legal(entry[4]):
+        return None
+    return entry[4]
+
+def search_root_move(board, move, depth, eval_choice, selective, timing=None):
+    global null_move_enabled, lmr_enabled, pvs_enabled, quiescence_enabled, search_stats
+    null_move_enabled, lmr_enabled, pvs_enabled, quiescence_enabled = selective
+    prepare_search(board, eval_choice)
+    # Search just below the best root score found by any worker so far. One
+    # extra point keeps ties exact, so the earliest of equal moves still wins.
+    beta = shared_root_bound.value + 1
+    start_nodes = search_nodes
+    start_quiescence = quiescence_nodes
+    # Counters are only collected when the parent is collecting them, and
+    # are sent back with the score to be added to its stats.
+    stats = search_stats = SearchStats(timing) if timing is not None else None
+    eval_score = None
+    try:
+        make_move(board, move)
+        eval_score = minimax(board, depth - 1, float('-inf'), beta, True)
+        unmake_move(board)
+    except SearchTimeout:
+        pass
+    finally:
+        search_stats = None
+    if stats is not None:
+        stats.finish(None, depth)
+    if eval_score is not None:
+        with shared_root_bound.get_lock():
+            if eval_score < shared_root_bound.value:
+                shared_root_bound.value = eval_score
+    return eval_score, search_nodes - start_nodes, quiescence_nodes - start_quiescence, stats
+
+def get_search_pool(workers):
+    global search_pool, search_pool_workers, shared_root_bound, search_stop
+    if search_pool is None or search_pool_workers != workers:
+        # Imported here so that single-process use never pays for them.
+        import concurrent.futures
+        import multiprocessing
+        shutdown_search_pool()
+        # Spawned rather than forked: forking from a search thread can
+        # deadlock on locks held by other threads, e.g. one blocked on stdin.
+        context = multiprocessing.get_context("spawn")
+        shared_root_bound = context.Value('d', float('inf'))
+        search_stop = context.Value('b', 0)
+        search_pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_search_worker, initargs=(shared_root_bound, search_stop))
+        search_pool_workers = workers
+    return search_pool
+
+def shutdown_search_pool():
+    global search_pool, search_pool_workers
+    if search_pool is not None:
+        search_pool.shutdown(cancel_futures=True)
+    search_pool = None
+    search_pool_workers = 0
+
+def get_best_move_parallel(board, depth, eval_choice=1, workers=None):
+    global search_nodes, quiescence_nodes, last_score, last_search_complete
+    last_search_complete = True
+    workers = workers or search_workers
+    if workers <= 1 or depth <= 1:
+        return get_best_move(board, depth, eval_choice)
+    root_key = prepare_search(board, eval_choice)
+    entry = transposition_table.probe(root_key)
+    legal_moves = order_moves(board, list(board.legal_moves), 0, entry[4] if entry else None)
+    for move in legal_moves:
+        board.push(move)
+        mate = board.is_checkmate()
+        board.pop()
+        if mate:
+            last_score = -MATE_SCORE
+            return move
+    import concurrent.futures
+    pool = get_search_pool(workers)
+    shared_root_bound.value = float('inf')
+    search_stop.value = 0
+    root_board = board.copy()
+    selective = (null_move_enabled, lmr_enabled, pvs_enabled, quiescence_enabled)
+    timing = search_stats.timing if search_stats is not None else None
+    futures = [pool.submit(search_root_move, root_board, move, depth, eval_choice, selective, timing) for move in legal_moves]
+    # Polled rather than joined so stop_search() is answered promptly: queued
+    # moves are cancelled and running workers see the shared stop flag.
+    pending = set(futures)
+    while pending:
+        _, pending = concurrent.futures.wait(pending, timeout=0.01)
+        if stop_requested and pending:
+            search_stop.value = 1
+            for future in pending:
+                future.cancel()
+            concurrent.futures.wait(pending)
+            break
+    scores = []
+    for future in futures:
+        if future.cancelled():
+            scores.append(None)
+            continue
+        eval_score, nodes, quiet_nodes, worker_stats = future.result()
+        scores.append(eval_score)
+        search_nodes += nodes
+        quiescence_nodes += quiet_nodes
+        if worker_stats is not None and search_stats is not None:
+            search_stats.merge(worker_stats)
+    searched = [index for index, score in enumerate(scores) if score is not None]
+    if not legal_moves:
+        return None
+    last_search_complete = len(searched) == len(scores)
+    if not searched:
+        last_score = 0
+        return legal_moves[0]
+    # Scores that failed high are above the final bound, so the minimum is exact.
+    best_index = min(searched, key=lambda index: scores[index])
+    if last_search_complete:
+        transposition_table.store(root_key, depth, scores[best_index], TT_EXACT, legal_moves[best_index])
+    last_score = scores[best_index]
+    return legal_moves[best_index]
+
+def allocate_time(remaining_ms, increment_ms=0, moves_to_go=None):
+    moves_to_go = moves_to_go or 30
+    budget = remaining_ms / moves_to_go + increment_ms * 0.8
+    return max(10, min(budget, remaining_ms * 0.5))
+
+def stop_search():
+    global stop_requested
+    stop_requested = True
+
+def search_interrupted():
+    # Pool workers also watch the stop flag shared with the process that
+    # started the search.
+    return stop_requested or time.perf_counter() > search_deadline or (shared_stop is not None and shared_stop.value)
+
+def iterative_deepening(board, time_limit_ms, eval_choice=1, max_depth=MAX_SEARCH_DEPTH, on_iteration=None):
+    global search_deadline, first_iteration_deadline, root_best, last_score
+    board = board.copy()
+    start = time.perf_counter()
+    deadline = start + time_limit_ms / 1000 if time_limit_ms is not None else float('inf')
+    start_nodes = search_nodes
+    best_move = None
+    depth_reached = 0
+    try:
+        for depth in range(1, max_depth + 1):
+            # Iterations stop at the deadline or on stop_search(), depth 1
+            # only once it has a move to play.
+            if depth == 1:
+                search_deadline = None
+                first_iteration_deadline = deadline
+                root_best = None
+            else:
+                search_deadline = deadline
+            move = get_best_move(board, depth, eval_choice)
+            if move is None:
+                break
+            best_move, depth_reached = move, depth
+            if on_iteration is not None:
+                on_iteration(depth, last_score, search_nodes - start_nodes, time.perf_counter() - start, principal_variation(board, depth))
+            if abs(last_score) >= MATE_SCORE or stop_requested:
+                break
+            # The next iteration costs several times this one, so don't start
+            # it once half the budget is gone.
+            if time.perf_counter() - start > (deadline - start) / 2:
+                break
+    except SearchTimeout:
+        if best_move is None and root_best is not None:
+            best_move, depth_reached = root_best[0], 1
+            last_score = root_best[1]
+    finally:
+        search_deadline = None
+        first_iteration_deadline = None
+    return best_move, depth_reached
+
+# Polyglot books are read through python-chess's memory-mapped reader, which
+# binary searches the sorted entries in place. The mapping is read-only, so
+# every process that opens the same file shares its pages.
+book_reader = None
+book_reader_path = None
+book_rng = random.Random()
+
+def open_book(path):
+    global book_path, book_reader, book_reader_path
+    close_book()
+    book_path = path
+    if path is not None:
+        book_reader = chess.polyglot.open_reader(path)
+        book_reader_path = path
+
+def close_book():
+    global book_reader, book_reader_path
+    if book_reader is not None:
+        book_reader.close()
+    book_reader = None
+    book_reader_path = None
+
+def book_move(board):
+    if book_path is None or board.ply() >= book_max_ply:
+        return None
+    if book_reader_path != book_path:
+        open_book(book_path)
+    if book_selection == "best":
+        entry = book_reader.get(board)
+    else:
+        try:
+            entry = book_reader.weighted_choice(board, random=book_rng)
+        except IndexError:
+            entry = None
+    return entry.move if entry is not None else None
+
+class PositionCache:
+    # Transposition entries kept in SQLite so they outlive the game and the
+    # process. Keys are the salted search keys, which are the same in every
+    # process because the salts come from a fixed seed. WAL mode lets several
+    # processes read while one writes.
+    def __init__(self, path, max_entries=1000000):
+        self.path = path
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS positions (key INTEGER PRIMARY KEY, depth INTEGER, score INTEGER, flag INTEGER, move TEXT, updated REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS positions_eviction ON positions (depth, updated)")
+
+    def close(self):
+        self.connection.close()
+
+    def probe(self, key):
+        row = self.connection.execute("SELECT depth, score, flag, move FROM positions WHERE key = ?", (signed_key(key),)).fetchone()
+        if row is None:
+            return None
+        depth, score, flag, move = row
+        return (key, depth, score, flag, chess.Move.from_uci(move) if move else None)
+
+    def store(self, entries):
+        now = time.time()
+        rows = [(signed_key(key), depth, score, flag, move.uci() if move else None, now) for key, depth, score, flag, move in entries]
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            # A shallower result never replaces a deeper one.
+            self.connection.executemany(
+                "INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                "depth = excluded.depth, score = excluded.score, flag = excluded.flag, move = excluded.move, updated = excluded.updated "
+                "WHERE excluded.depth >= positions.depth", rows)
+            excess = self.connection.execute("SELECT COUNT(*) FROM positions").fetchone()[0] - self.max_entries
+            if excess > 0:
+                # Evict the shallowest entries first, oldest among equals.
+                self.connection.execute("DELETE FROM positions WHERE key IN (SELECT key FROM positions ORDER BY depth, updated LIMIT ?)", (excess,))
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+def signed_key(key):
+    # SQLite integers are signed 64-bit.
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+position_cache = None
+
+def open_position_cache(path, max_entries=None):
+    global cache_path, position_cache
+    close_position_cache()
+    cache_path = path
+    if max_entries is not None:
+        set_cache_size(max_entries)
+    if path is not None:
+        position_cache = PositionCache(path, cache_max_entries)
+
+def close_position_cache():
+    global position_cache
+    if position_cache is not None:
+        position_cache.close()
+    position_cache = None
+
+def set_cache_size(max_entries):
+    global cache_max_entries
+    cache_max_entries = max_entries
+    if position_cache is not None:
+        position_cache.max_entries = max_entries
+
+def load_cached_position(board, eval_choice=1):
+    # Seeds the transposition table with the cached root entry, if any.
+    if position_cache is None:
+        return None
+    entry = position_cache.probe(chess.polyglot.zobrist_hash(board) ^ salt_for(board.turn, eval_choice))
+    if entry is None or (entry[4] is not None and not board.is_legal(entry[4])):
+        return None
+    transposition_table.store(*entry)
+    return entry
+
+def save_search(board, eval_choice=1, max_length=8):
+    # Writes back the root entry and the principal variation below it.
+    if position_cache is None:
+        return
+    salt = salt_for(board.turn, eval_choice)
+    board = board.copy(stack=False)
+    entries = []
+    while len(entries) < max_length:
+        entry = transposition_table.probe(chess.polyglot.zobrist_hash(board) ^ salt)
+        if entry is None or entry[4] is None or not board.is_legal(entry[4]):
+            break
+        entries.append(entry)
+        board.push(entry[4])
+    if entries:
+        position_cache.store(entries)
+
+def search_with_stats(board, depth=None, time_limit_ms=None, eval_choice=1, timing=False, on_iteration=None, interruptible=False):
+    global search_stats, last_score
+    stats = SearchStats(timing)
+    move = book_move(board)
+    if move is not None:
+        last_score = 0
+        stats.book = True
+        stats.finish(move, 0)
+        return move, stats
+    if position_cache is None and cache_path is not None:
+        open_position_cache(cache_path)
+    cached = load_cached_position(board, eval_choice)
+    if cached is not None and time_limit_ms is None and depth is not None and cached[1] >= depth and cached[3] == TT_EXACT and cached[4] is not None:
+        last_score = cached[2]
+        stats.cached = True
+        stats.finish(cached[4], cached[1])
+        return cached[4], stats
+    search_stats = stats
+    try:
+        # Iterative deepening is the only path stop_search() can interrupt.
+        if time_limit_ms is not None or on_iteration is not None or interruptible:
+            move, depth_reached = iterative_deepening(board, time_limit_ms, eval_choice, depth or MAX_SEARCH_DEPTH, on_iteration)
+        else:
+            move, depth_reached = get_best_move_parallel(board, depth, eval_choice), depth
+    finally:
+        search_stats = None
+    stats.finish(move, depth_reached)
+    if move is not None:
+        save_search(board, eval_choice)
+    return move, stats
+
+def set_hash_size(megabytes):
+    global tt_megabytes, transposition_table
+    tt_megabytes = megabytes
+    transposition_table = TranspositionTable(megabytes=megabytes)
+
+def new_game():
+    transposition_table.clear()
+    reset_move_ordering()
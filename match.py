@@ -0,0 +1,199 @@
+import argparse
+import concurrent.futures
+import math
+import multiprocessing
+import os
+import chess
+import chess.pgn
+import engine
+
+openings = [
+    ("Italian", "e4 e5 Nf3 Nc6 Bc4 Bc5"),
+    ("Ruy Lopez", "e4 e5 Nf3 Nc6 Bb5 a6 Ba4 Nf6"),
+    ("Sicilian", "e4 c5 Nf3 d6 d4 cxd4 Nxd4 Nf6"),
+    ("French", "e4 e6 d4 d5 Nc3 Nf6"),
+    ("Caro-Kann", "e4 c6 d4 d5 Nc3 dxe4 Nxe4"),
+    ("Queen's Gambit", "d4 d5 c4 e6 Nc3 Nf6"),
+    ("King's Indian", "d4 Nf6 c4 g6 Nc3 Bg7 e4 d6"),
+    ("English", "c4 e5 Nc3 Nf6 g3"),
+]
+
+default_options = {"depth": 3, "time": None, "eval": 1, "backend": engine.eval_backend, "ordering": True, "book": None,
+                   "null": False, "lmr": False, "pvs": False, "aspiration": False, "searchboard": False, "quiescence": False}
+switch_options = ("ordering", "null", "lmr", "pvs", "aspiration", "searchboard", "quiescence")
+
+def parse_config(text):
+    options = dict(default_options)
+    for item in text.split(","):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in options:
+            raise argparse.ArgumentTypeError(f"unknown option {name!r}, expected one of {', '.join(options)}")
+        if name in ("depth", "time", "eval"):
+            options[name] = int(value)
+        elif name in switch_options:
+            options[name] = value.lower() not in ("0", "false", "no", "off")
+        else:
+            options[name] = value
+    return options
+
+def describe(options):
+    limit = f"{options['time']}ms" if options["time"] else f"d{options['depth']}"
+    selective = [name for name in ("null", "lmr", "pvs", "aspiration", "searchboard", "quiescence") if options[name]]
+    return f"{limit} E{options['eval']}" + "".join(f" +{name}" for name in selective)
+
+def load_openings(path):
+    suite = []
+    with open(path) as opening_file:
+        for number, line in enumerate(opening_file, 1):
+            line = line.strip()
+            if line and not line.startswith("#"):
+                suite.append((f"{path}:{number}", line))
+    return suite
+
+def play_game(number, opening, moves, white, black, max_plies, cache_paths):
+    engine.search_workers = 1
+    engine.new_game()
+    board = chess.Board()
+    for san in moves.split():
+        board.push_san(san)
+    configs = {chess.WHITE: white, chess.BLACK: black}
+    nodes = {chess.WHITE: 0, chess.BLACK: 0}
+    elapsed = {chess.WHITE: 0.0, chess.BLACK: 0.0}
+    while not board.is_game_over(claim_draw=True) and board.ply() < max_plies:
+        options = configs[board.turn]
+        engine.eval_backend = options["backend"]
+        engine.ordering_enabled = options["ordering"]
+        engine.book_path = options["book"]
+        engine.null_move_enabled = options["null"]
+        engine.lmr_enabled = options["lmr"]
+        engine.pvs_enabled = options["pvs"]
+        engine.aspiration_enabled = options["aspiration"]
+        engine.search_board_enabled = options["searchboard"]
+        if cache_paths[board.turn] != engine.cache_path:
+            engine.open_position_cache(cache_paths[board.turn])
+        engine.quiescence_enabled = options["quiescence"]
+        if options["time"]:
+            move, stats = engine.search_with_stats(board, time_limit_ms=options["time"], eval_choice=options["eval"])
+        else:
+            move, stats = engine.search_with_stats(board, options["depth"], eval_choice=options["eval"])
+        nodes[board.turn] += stats.nodes
+        elapsed[board.turn] += stats.time
+        board.push(move)
+    engine.close_position_cache()
+    result = board.result(claim_draw=True)
+    adjudicated = result == "*"
+    if adjudicated:
+        result = "1/2-1/2"
+    return number, opening, [move.uci() for move in board.move_stack], result, adjudicated, nodes, elapsed
+
+def score_to_elo(score):
+    if score <= 0:
+        return float("-inf")
+    if score >= 1:
+        return float("inf")
+    return -400 * math.log10(1 / score - 1)
+
+def cache_paths_for(first, second, cache_path):
+    # A cached result deep enough for one engine would answer the other's
+    # searches, so differing configurations never share a cache file.
+    if cache_path is None or first == second:
+        return cache_path, cache_path
+    root, extension = os.path.splitext(cache_path)
+    return f"{root}-a{extension}", f"{root}-b{extension}"
+
+def elo_difference(wins, draws, losses):
+    # Elo estimate from the mean game score, with a 95% interval taken from
+    # the score's standard error.
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    deviation = math.sqrt((wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games)
+    margin = 1.96 * deviation / math.sqrt(games)
+    return score_to_elo(score), score_to_elo(score - margin), score_to_elo(score + margin)
+
+def write_game(pgn_file, number, opening, moves, result, adjudicated, white_name, black_name):
+    game = chess.pgn.Game()
+    game.headers["Event"] = "Minimax Chess self-play"
+    game.headers["Round"] = str(number + 1)
+    game.headers["White"] = white_name
+    game.headers["Black"] = black_name
+    game.headers["Result"] = result
+    game.headers["Opening"] = opening
+    if adjudicated:
+        game.headers["Termination"] = "adjudication"
+    node = game
+    for uci_move in moves:
+        node = node.add_variation(chess.Move.from_uci(uci_move))
+    print(game, file=pgn_file, end="\n\n", flush=True)
+
+def run_match(first, second, games, suite, workers, max_plies, pgn_path=None, cache_path=None):
+    names = [f"A ({describe(first)})", f"B ({describe(second)})"]
+    wins = draws = losses = 0
+    nodes = [0, 0]
+    elapsed = [0.0, 0.0]
+    pgn_file = open(pgn_path, "w") if pgn_path else None
+    first_cache, second_cache = cache_paths_for(first, second, cache_path)
+    context = multiprocessing.get_context("spawn")
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {}
+            for number in range(games):
+                # Each opening is played twice in a row with colors swapped.
+                opening, moves = suite[(number // 2) % len(suite)]
+                a_white = number % 2 == 0
+                white, black = (first, second) if a_white else (second, first)
+                caches = {chess.WHITE: first_cache, chess.BLACK: second_cache} if a_white else {chess.WHITE: second_cache, chess.BLACK: first_cache}
+                future = pool.submit(play_game, number, opening, moves, white, black, max_plies, caches)
+                futures[future] = a_white
+            for future in concurrent.futures.as_completed(futures):
+                a_white = futures[future]
+                number, opening, moves, result, adjudicated, game_nodes, game_elapsed = future.result()
+                a_color, b_color = (chess.WHITE, chess.BLACK) if a_white else (chess.BLACK, chess.WHITE)
+                nodes[0] += game_nodes[a_color]
+                nodes[1] += game_nodes[b_color]
+                elapsed[0] += game_elapsed[a_color]
+                elapsed[1] += game_elapsed[b_color]
+                if result == "1/2-1/2":
+                    draws += 1
+                elif (result == "1-0") == a_white:
+                    wins += 1
+                else:
+                    losses += 1
+                white_name, black_name = (names[0], names[1]) if a_white else (names[1], names[0])
+                if pgn_file:
+                    write_game(pgn_file, number, opening, moves, result, adjudicated, white_name, black_name)
+                print(f"game {number + 1:>4} {opening:<16} {white_name} vs {black_name}: {result}  (+{wins} ={draws} -{losses})", flush=True)
+    finally:
+        if pgn_file:
+            pgn_file.close()
+    return {"names": names, "wins": wins, "draws": draws, "losses": losses, "nodes": nodes, "time": elapsed}
+
+def report(summary):
+    wins, draws, losses = summary["wins"], summary["draws"], summary["losses"]
+    elo, low, high = elo_difference(wins, draws, losses)
+    print(f"{summary['names'][0]} vs {summary['names'][1]}: +{wins} ={draws} -{losses}")
+    if math.isinf(elo):
+        print(f"Elo difference: {'+' if elo > 0 else '-'}inf")
+    else:
+        print(f"Elo difference: {elo:+.1f} (95% interval {low:+.1f} to {high:+.1f})")
+    for name, nodes, elapsed in zip(summary["names"], summary["nodes"], summary["time"]):
+        print(f"{name}: {nodes} nodes in {elapsed:.1f}s, {nodes / elapsed if elapsed > 0 else 0:.0f} nps")
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a headless self-play match between two search configurations.")
+    parser.add_argument("first", type=parse_config, help="options for engine A, e.g. depth=3,eval=2 or time=500,eval=3,backend=bitboard")
+    parser.add_argument("second", type=parse_config, help="options for engine B")
+    parser.add_argument("--games", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--openings", help="read openings from a file of SAN move lists, one per line")
+    parser.add_argument("--max-plies", type=int, default=300, help="adjudicate a draw after this many plies")
+    parser.add_argument("--pgn", help="write finished games to this PGN file as they finish")
+    parser.add_argument("--cache", help="persistent position cache shared by all games, one file per engine when their options differ")
+    args = parser.parse_args()
+
+    suite = load_openings(args.openings) if args.openings else openings
+    summary = run_match(args.first, args.second, args.games, suite, args.workers, args.max_plies, args.pgn, args.cache)
+    report(summary)
+
+if __name__ == "__main__":
+    main()
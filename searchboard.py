@@ -0,0 +1,466 @@
+import chess
+import chess.polyglot
+
+# A 0x88 mailbox board for the search. Squares are rank * 16 + file, so any
+# index with a bit of 0x88 set is off the board. Pieces are the python-chess
+# piece type, plus 8 for black. Moves are plain ints:
+# from | to << 7 | promotion << 14.
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+BLACK_BIT = 8
+KNIGHT_OFFSETS = (33, 31, 18, 14, -14, -18, -31, -33)
+BISHOP_OFFSETS = (15, 17, -15, -17)
+ROOK_OFFSETS = (1, -1, 16, -16)
+KING_OFFSETS = ROOK_OFFSETS + BISHOP_OFFSETS
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+
+def square_88(square):
+    return square + (square & ~7)
+
+def square_64(square):
+    return (square + (square & 7)) >> 1
+
+# Polyglot keys by piece code and 0x88 square, so hashes match
+# chess.polyglot.zobrist_hash() for the same position.
+random_array = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+piece_keys = [[0] * 128 for _ in range(16)]
+for piece_type in range(1, 7):
+    for color in chess.COLORS:
+        code = piece_type if color == chess.WHITE else piece_type | BLACK_BIT
+        for square in chess.SQUARES:
+            piece_keys[code][square_88(square)] = random_array[64 * ((piece_type - 1) * 2 + int(color)) + square]
+castling_keys = [0] * 16
+for rights in range(16):
+    for bit in range(4):
+        if rights & (1 << bit):
+            castling_keys[rights] ^= random_array[768 + bit]
+ep_keys = [random_array[772 + file] for file in range(8)]
+turn_key = random_array[780]
+
+# Castling rights kept after a move touches a square.
+castling_masks = [15] * 128
+castling_masks[0x04] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+castling_masks[0x00] = 15 & ~WHITE_QUEENSIDE
+castling_masks[0x07] = 15 & ~WHITE_KINGSIDE
+castling_masks[0x74] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+castling_masks[0x70] = 15 & ~BLACK_QUEENSIDE
+castling_masks[0x77] = 15 & ~BLACK_KINGSIDE
+
+# Queen-line direction between two squares by 0x88 difference, or 0. A piece
+# that is not lined up with its own king can never be pinned.
+ray_offsets = [0] * 239
+for offset in KING_OFFSETS:
+    for distance in range(1, 8):
+        ray_offsets[offset * distance + 119] = offset
+
+def build_score_tables(piece_values, square_value):
+    # Signed (white positive) material and piece-square values by piece code
+    # and 0x88 square.
+    material = [0] * 16
+    positional = [[0] * 128 for _ in range(16)]
+    for piece_type in range(1, 7):
+        for color in chess.COLORS:
+            code = piece_type if color == chess.WHITE else piece_type | BLACK_BIT
+            sign = 1 if color == chess.WHITE else -1
+            material[code] = sign * piece_values[piece_type]
+            for square in chess.SQUARES:
+                positional[code][square_88(square)] = sign * square_value(piece_type, color, square)
+    return material, positional
+
+move_cache = {}
+
+def to_chess_move(move):
+    chess_move = move_cache.get(move)
+    if chess_move is None:
+        promotion = move >> 14
+        chess_move = chess.Move(square_64(move & 127), square_64((move >> 7) & 127), promotion or None)
+        move_cache[move] = chess_move
+    return chess_move
+
+def from_chess_move(move):
+    return square_88(move.from_square) | square_88(move.to_square) << 7 | (move.promotion or 0) << 14
+
+class SearchBoard:
+    __slots__ = ("squares", "turn", "castling", "ep_square", "ep_hash", "halfmove_clock", "hash", "kings",
+                 "piece_squares", "counts", "material", "positional", "stack", "material_values", "positional_values")
+
+    def __init__(self, board, material_values=None, positional_values=None):
+        self.squares = [0] * 128
+        self.piece_squares = {chess.WHITE: set(), chess.BLACK: set()}
+        self.counts = [0] * 16
+        self.kings = {chess.WHITE: -1, chess.BLACK: -1}
+        self.material_values = material_values or [0] * 16
+        self.positional_values = positional_values or [[0] * 128 for _ in range(16)]
+        self.material = 0
+        self.positional = 0
+        self.hash = 0
+        for square, piece in board.piece_map().items():
+            code = piece.piece_type if piece.color == chess.WHITE else piece.piece_type | BLACK_BIT
+            self.put(code, square_88(square))
+        self.turn = board.turn
+        self.castling = 0
+        if board.has_kingside_castling_rights(chess.WHITE):
+            self.castling |= WHITE_KINGSIDE
+        if board.has_queenside_castling_rights(chess.WHITE):
+            self.castling |= WHITE_QUEENSIDE
+        if board.has_kingside_castling_rights(chess.BLACK):
+            self.castling |= BLACK_KINGSIDE
+        if board.has_queenside_castling_rights(chess.BLACK):
+            self.castling |= BLACK_QUEENSIDE
+        self.ep_square = square_88(board.ep_square) if board.ep_square is not None else -1
+        self.ep_hash = self.en_passant_key()
+        self.halfmove_clock = board.halfmove_clock
+        self.hash ^= castling_keys[self.castling] ^ self.ep_hash
+        if self.turn == chess.WHITE:
+            self.hash ^= turn_key
+        self.stack = []
+
+    def put(self, code, square):
+        self.squares[square] = code
+        self.piece_squares[not code & BLACK_BIT].add(square)
+        self.counts[code] += 1
+        self.hash ^= piece_keys[code][square]
+        self.material += self.material_values[code]
+        self.positional += self.positional_values[code][square]
+        if code & 7 == KING:
+            self.kings[not code & BLACK_BIT] = square
+
+    def remove(self, square):
+        code = self.squares[square]
+        self.squares[square] = 0
+        self.piece_squares[not code & BLACK_BIT].discard(square)
+        self.counts[code] -= 1
+        self.hash ^= piece_keys[code][square]
+        self.material -= self.material_values[code]
+        self.positional -= self.positional_values[code][square]
+        return code
+
+    def en_passant_key(self):
+        # Polyglot only hashes the en passant file when a pawn of the side to
+        # move stands next to the double-pushed pawn.
+        if self.ep_square < 0:
+            return 0
+        pawn = PAWN if self.turn == chess.WHITE else PAWN | BLACK_BIT
+        target = self.ep_square - 16 if self.turn == chess.WHITE else self.ep_square + 16
+        for square in (target - 1, target + 1):
+            if not square & 0x88 and self.squares[square] == pawn:
+                return ep_keys[self.ep_square & 7]
+        return 0
+
+    def to_board(self):
+        board = chess.Board(None)
+        for square in range(128):
+            code = self.squares[square]
+            if code and not square & 0x88:
+                board.set_piece_at(square_64(square), chess.Piece(code & 7, not code & BLACK_BIT))
+        board.turn = self.turn
+        fen_rights = ""
+        for bit, letter in ((WHITE_KINGSIDE, "K"), (WHITE_QUEENSIDE, "Q"), (BLACK_KINGSIDE, "k"), (BLACK_QUEENSIDE, "q")):
+            if self.castling & bit:
+                fen_rights += letter
+        board.set_castling_fen(fen_rights or "-")
+        board.ep_square = square_64(self.ep_square) if self.ep_square >= 0 else None
+        board.halfmove_clock = self.halfmove_clock
+        return board
+
+    def is_attacked(self, square, by_white):
+        squares = self.squares
+        enemy = 0 if by_white else BLACK_BIT
+        pawn_from = square - 16 if by_white else square + 16
+        for attacker in (pawn_from - 1, pawn_from + 1):
+            if not attacker & 0x88 and squares[attacker] == PAWN | enemy:
+                return True
+        for offset in KNIGHT_OFFSETS:
+            attacker = square + offset
+            if not attacker & 0x88 and squares[attacker] == KNIGHT | enemy:
+                return True
+        for offset in KING_OFFSETS:
+            attacker = square + offset
+            if not attacker & 0x88 and squares[attacker] == KING | enemy:
+                return True
+        diagonal = (BISHOP | enemy, QUEEN | enemy)
+        for offset in BISHOP_OFFSETS:
+            attacker = square + offset
+            while not attacker & 0x88:
+                code = squares[attacker]
+                if code:
+                    if code in diagonal:
+                        return True
+                    break
+                attacker += offset
+        straight = (ROOK | enemy, QUEEN | enemy)
+        for offset in ROOK_OFFSETS:
+            attacker = square + offset
+            while not attacker & 0x88:
+                code = squares[attacker]
+                if code:
+                    if code in straight:
+                        return True
+                    break
+                attacker += offset
+        return False
+
+    def is_check(self):
+        return self.is_attacked(self.kings[self.turn], not self.turn)
+
+    def generate_pseudo_legal_moves(self):
+        moves = []
+        squares = self.squares
+        white = self.turn
+        own = 0 if white else BLACK_BIT
+        for square in self.piece_squares[white]:
+            piece = squares[square] & 7
+            if piece == PAWN:
+                forward = 16 if white else -16
+                target = square + forward
+                last_rank = (target >> 4) == (7 if white else 0)
+                if not target & 0x88 and not squares[target]:
+                    if last_rank:
+                        for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                            moves.append(square | target << 7 | promotion << 14)
+                    else:
+                        moves.append(square | target << 7)
+                        if (square >> 4) == (1 if white else 6) and not squares[target + forward]:
+                            moves.append(square | (target + forward) << 7)
+                for capture in (target - 1, target + 1):
+                    if capture & 0x88:
+                        continue
+                    code = squares[capture]
+                    if code and (code & BLACK_BIT) != own:
+                        if last_rank:
+                            for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                                moves.append(square | capture << 7 | promotion << 14)
+                        else:
+                            moves.append(square | capture << 7)
+                    elif capture == self.ep_square:
+                        moves.append(square | capture << 7)
+            elif piece == KNIGHT or piece == KING:
+                for offset in (KNIGHT_OFFSETS if piece == KNIGHT else KING_OFFSETS):
+                    target = square + offset
+                    if target & 0x88:
+                        continue
+                    code = squares[target]
+                    if not code or (code & BLACK_BIT) != own:
+                        moves.append(square | target << 7)
+                if piece == KING:
+                    self.add_castling_moves(square, moves)
+            else:
+                offsets = BISHOP_OFFSETS if piece == BISHOP else ROOK_OFFSETS if piece == ROOK else KING_OFFSETS
+                for offset in offsets:
+                    target = square + offset
+                    while not target & 0x88:
+                        code = squares[target]
+                        if code:
+                            if (code & BLACK_BIT) != own:
+                                moves.append(square | target << 7)
+                            break
+                        moves.append(square | target << 7)
+                        target += offset
+        return moves
+
+    def add_castling_moves(self, square, moves):
+        white = self.turn
+        kingside, queenside = (WHITE_KINGSIDE, WHITE_QUEENSIDE) if white else (BLACK_KINGSIDE, BLACK_QUEENSIDE)
+        if not self.castling & (kingside | queenside) or self.is_attacked(square, not white):
+            return
+        squares = self.squares
+        # The destination square is checked by the legality test after the move.
+        if self.castling & kingside and not squares[square + 1] and not squares[square + 2] and not self.is_attacked(square + 1, not white):
+            moves.append(square | (square + 2) << 7)
+        if self.castling & queenside and not squares[square - 1] and not squares[square - 2] and not squares[square - 3] and not self.is_attacked(square - 1, not white):
+            moves.append(square | (square - 2) << 7)
+
+    def is_legal_after_push(self):
+        # The side that just moved must not have left its king in check.
+        return not self.is_attacked(self.kings[not self.turn], self.turn)
+
+    def pinned_pieces(self, king):
+        # Own pieces pinned to the king, mapped to the direction of the pin.
+        squares = self.squares
+        own = 0 if self.turn == chess.WHITE else BLACK_BIT
+        enemy = own ^ BLACK_BIT
+        pinned = {}
+        for offset in KING_OFFSETS:
+            sliders = (ROOK | enemy, QUEEN | enemy) if offset in ROOK_OFFSETS else (BISHOP | enemy, QUEEN | enemy)
+            square = king + offset
+            candidate = -1
+            while not square & 0x88:
+                code = squares[square]
+                if code:
+                    if candidate < 0 and (code & BLACK_BIT) == own:
+                        candidate = square
+                    else:
+                        if candidate >= 0 and code in sliders:
+                            pinned[candidate] = offset
+                        break
+                square += offset
+        return pinned
+
+    def is_legal(self, move, king, pinned):
+        # Out of check, only king moves, en passant and pinned pieces need
+        # more than the pseudo-legal test.
+        from_square = move & 127
+        to_square = (move >> 7) & 127
+        if from_square == king or to_square == self.ep_square:
+            self.push(move)
+            legal = self.is_legal_after_push()
+            self.pop()
+            return legal
+        if from_square in pinned:
+            return ray_offsets[to_square - king + 119] == pinned[from_square]
+        return True
+
+    def generate_legal_moves(self):
+        moves = self.generate_pseudo_legal_moves()
+        legal_moves = []
+        if self.is_check():
+            for move in moves:
+                self.push(move)
+                if self.is_legal_after_push():
+                    legal_moves.append(move)
+                self.pop()
+            return legal_moves
+        king = self.kings[self.turn]
+        pinned = self.pinned_pieces(king)
+        for move in moves:
+            if self.is_legal(move, king, pinned):
+                legal_moves.append(move)
+        return legal_moves
+
+    def has_legal_move(self):
+        if self.is_check():
+            for move in self.generate_pseudo_legal_moves():
+                self.push(move)
+                legal = self.is_legal_after_push()
+                self.pop()
+                if legal:
+                    return True
+            return False
+        king = self.kings[self.turn]
+        pinned = self.pinned_pieces(king)
+        # Out of check, any free step by a piece other than the king or a
+        # pinned piece is a legal move, so most positions stop here.
+        squares = self.squares
+        own = 0 if self.turn == chess.WHITE else BLACK_BIT
+        for square in self.piece_squares[self.turn]:
+            if square == king or square in pinned:
+                continue
+            piece = squares[square] & 7
+            if piece == PAWN:
+                target = square + (16 if own == 0 else -16)
+                if not squares[target]:
+                    return True
+                for capture in (target - 1, target + 1):
+                    if not capture & 0x88 and squares[capture] and (squares[capture] & BLACK_BIT) != own:
+                        return True
+                continue
+            offsets = KNIGHT_OFFSETS if piece == KNIGHT else BISHOP_OFFSETS if piece == BISHOP else ROOK_OFFSETS if piece == ROOK else KING_OFFSETS
+            for offset in offsets:
+                target = square + offset
+                if not target & 0x88 and (not squares[target] or (squares[target] & BLACK_BIT) != own):
+                    return True
+        for move in self.generate_pseudo_legal_moves():
+            if self.is_legal(move, king, pinned):
+                return True
+        return False
+
+    def is_capture(self, move):
+        to_square = (move >> 7) & 127
+        return bool(self.squares[to_square]) or (to_square == self.ep_square and self.squares[move & 127] & 7 == PAWN)
+
+    def captured_piece_type(self, move):
+        to_square = (move >> 7) & 127
+        code = self.squares[to_square]
+        if code:
+            return code & 7
+        if to_square == self.ep_square and self.squares[move & 127] & 7 == PAWN:
+            return PAWN
+        return 0
+
+    def push(self, move):
+        from_square = move & 127
+        to_square = (move >> 7) & 127
+        promotion = move >> 14
+        squares = self.squares
+        self.stack.append((move, squares[to_square], self.castling, self.ep_square, self.ep_hash, self.halfmove_clock, self.hash, self.material, self.positional))
+        code = self.remove(from_square)
+        piece = code & 7
+        captured = squares[to_square]
+        if captured:
+            self.remove(to_square)
+        if piece == PAWN:
+            self.halfmove_clock = 0
+            if to_square == self.ep_square:
+                self.remove(to_square - 16 if self.turn == chess.WHITE else to_square + 16)
+        elif captured:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        self.put(promotion | (code & BLACK_BIT) if promotion else code, to_square)
+        if piece == KING and abs(to_square - from_square) == 2:
+            if to_square > from_square:
+                self.put(self.remove(to_square + 1), to_square - 1)
+            else:
+                self.put(self.remove(to_square - 2), to_square + 1)
+        rights = self.castling & castling_masks[from_square] & castling_masks[to_square]
+        self.hash ^= castling_keys[self.castling] ^ castling_keys[rights] ^ self.ep_hash ^ turn_key
+        self.castling = rights
+        self.turn = not self.turn
+        if piece == PAWN and abs(to_square - from_square) == 32:
+            self.ep_square = (from_square + to_square) >> 1
+            self.ep_hash = self.en_passant_key()
+            self.hash ^= self.ep_hash
+        else:
+            self.ep_square = -1
+            self.ep_hash = 0
+
+    def pop(self):
+        move, captured, self.castling, self.ep_square, self.ep_hash, self.halfmove_clock, hash_key, material, positional = self.stack.pop()
+        self.turn = not self.turn
+        from_square = move & 127
+        to_square = (move >> 7) & 127
+        code = self.remove(to_square)
+        if move >> 14:
+            code = PAWN | (code & BLACK_BIT)
+        self.put(code, from_square)
+        if captured:
+            self.put(captured, to_square)
+        piece = code & 7
+        if piece == PAWN and to_square == self.ep_square:
+            self.put(PAWN | (0 if self.turn == chess.BLACK else BLACK_BIT), to_square - 16 if self.turn == chess.WHITE else to_square + 16)
+        elif piece == KING and abs(to_square - from_square) == 2:
+            if to_square > from_square:
+                self.put(self.remove(to_square - 1), to_square + 1)
+            else:
+                self.put(self.remove(to_square + 1), to_square - 2)
+        self.hash, self.material, self.positional = hash_key, material, positional
+
+    def is_insufficient_material(self):
+        counts = self.counts
+        if counts[PAWN] or counts[ROOK] or counts[QUEEN] or counts[PAWN | BLACK_BIT] or counts[ROOK | BLACK_BIT] or counts[QUEEN | BLACK_BIT]:
+            return False
+        knights = counts[KNIGHT] + counts[KNIGHT | BLACK_BIT]
+        bishops = counts[BISHOP] + counts[BISHOP | BLACK_BIT]
+        if knights:
+            # A lone knight against a bare king (or a king and queens).
+            return knights == 1 and not bishops
+        if bishops:
+            colors = set()
+            for square in range(128):
+                if not square & 0x88 and self.squares[square] & 7 == BISHOP:
+                    colors.add(((square >> 4) + square) & 1)
+            return len(colors) == 1
+        return True
+
+def perft(board, depth):
+    if depth == 0:
+        return 1
+    legal_moves = board.generate_legal_moves()
+    if depth == 1:
+        return len(legal_moves)
+    nodes = 0
+    for move in legal_moves:
+        board.push(move)
+        nodes += perft(board, depth - 1)
+        board.pop()
+    return nodes
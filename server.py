@@ -0,0 +1,209 @@
+import argparse
+import asyncio
+import concurrent.futures
+import multiprocessing
+import time
+import chess
+import engine
+
+eval_choices = {"E1": 1, "E2": 2, "E3": 3}
+search_pool = None
+search_slots = None
+max_pending = 64
+pending_searches = 0
+game_counter = 0
+server_started = time.perf_counter()
+server_totals = {"games": 0, "searches": 0, "nodes": 0, "rejected": 0}
+
+def init_worker():
+    engine.search_workers = 1
+
+def search_position(fen, moves, depth, time_limit, eval_choice, backend):
+    # Runs in a pool process; the move list is replayed so repetitions are seen.
+    engine.eval_backend = backend
+    board = chess.Board(fen)
+    for uci_move in moves:
+        board.push_uci(uci_move)
+    if time_limit:
+        move, stats = engine.search_with_stats(board, time_limit_ms=time_limit, eval_choice=eval_choice)
+    else:
+        move, stats = engine.search_with_stats(board, depth, eval_choice=eval_choice)
+    return move.uci() if move else None, stats.score, stats.nodes, stats.time
+
+class Game:
+    def __init__(self, number):
+        self.number = number
+        self.board = chess.Board()
+        self.depth = 3
+        self.time_limit = None
+        self.eval_choice = 1
+        self.backend = engine.eval_backend
+        self.connected = time.perf_counter()
+        self.searches = 0
+        self.nodes = 0
+        self.search_time = 0.0
+        self.wait_time = 0.0
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, nodes, search_time, wait_time, latency):
+        self.searches += 1
+        self.nodes += nodes
+        self.search_time += search_time
+        self.wait_time += wait_time
+        self.latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        server_totals["searches"] += 1
+        server_totals["nodes"] += nodes
+
+    def metrics(self):
+        searches = max(1, self.searches)
+        minutes = (time.perf_counter() - self.connected) / 60
+        nps = self.nodes / self.search_time if self.search_time > 0 else 0
+        return (f"stats game {self.number} searches {self.searches} nodes {self.nodes} nps {nps:.0f} "
+                f"latency_avg {1000 * self.latency / searches:.0f}ms latency_max {1000 * self.max_latency:.0f}ms "
+                f"wait_avg {1000 * self.wait_time / searches:.0f}ms searches_per_min {self.searches / minutes if minutes > 0 else 0:.1f}")
+
+def server_metrics():
+    uptime = time.perf_counter() - server_started
+    return (f"server games {server_totals['games']} pending {pending_searches} searches {server_totals['searches']} "
+            f"rejected {server_totals['rejected']} nodes {server_totals['nodes']} "
+            f"searches_per_sec {server_totals['searches'] / uptime if uptime > 0 else 0:.2f}")
+
+def game_over_lines(board):
+    if board.is_game_over(claim_draw=True):
+        return [f"gameover {board.result(claim_draw=True)}"]
+    return []
+
+async def request_search(game):
+    global pending_searches
+    # Backpressure: refuse new work instead of letting the queue grow without
+    # bound. The semaphore hands out pool slots in arrival order, and a game
+    # only ever has one search outstanding, so busy games cannot starve others.
+    if pending_searches >= max_pending:
+        server_totals["rejected"] += 1
+        return None
+    board = game.board
+    queued = time.perf_counter()
+    pending_searches += 1
+    try:
+        async with search_slots:
+            started = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(search_pool, search_position, board.root().fen(), [move.uci() for move in board.move_stack],
+                                                game.depth, game.time_limit, game.eval_choice, game.backend)
+    finally:
+        pending_searches -= 1
+    finished = time.perf_counter()
+    move, score, nodes, search_time = result
+    game.record(nodes, search_time, started - queued, finished - queued)
+    return move, score, nodes, finished - queued
+
+def set_option(game, tokens):
+    if len(tokens) != 2:
+        return "error usage: set depth|time|eval|backend VALUE"
+    name, value = tokens[0].lower(), tokens[1]
+    if name == "depth" and value.isdigit() and int(value) > 0:
+        game.depth = int(value)
+        game.time_limit = None
+    elif name == "time" and value.isdigit():
+        game.time_limit = int(value) or None
+    elif name == "eval" and value.upper() in eval_choices:
+        game.eval_choice = eval_choices[value.upper()]
+    elif name == "eval" and value in ("1", "2", "3"):
+        game.eval_choice = int(value)
+    elif name == "backend" and value in ("incremental", "bitboard", "numpy", "scan"):
+        game.backend = value
+    else:
+        return f"error bad option {name} {value}"
+    return "ok"
+
+async def handle_command(game, tokens):
+    command = tokens[0].lower()
+    if command == "new":
+        try:
+            game.board = chess.Board(" ".join(tokens[2:])) if len(tokens) > 2 and tokens[1] == "fen" else chess.Board()
+        except ValueError:
+            return ["error bad fen"]
+        return ["ok"]
+    if command == "move" and len(tokens) == 2:
+        try:
+            move = game.board.parse_uci(tokens[1])
+        except ValueError:
+            return [f"error illegal move {tokens[1]}"]
+        game.board.push(move)
+        return ["ok"] + game_over_lines(game.board)
+    if command == "go":
+        if game.board.is_game_over(claim_draw=True):
+            return ["error game over"] + game_over_lines(game.board)
+        result = await request_search(game)
+        if result is None:
+            return ["busy"]
+        move, score, nodes, latency = result
+        game.board.push_uci(move)
+        return [f"bestmove {move} score {score} nodes {nodes} time {int(latency * 1000)}"] + game_over_lines(game.board)
+    if command == "set":
+        return [set_option(game, tokens[1:])]
+    if command == "fen":
+        return [game.board.fen()]
+    if command == "stats":
+        return [game.metrics()]
+    if command == "server":
+        return [server_metrics()]
+    return [f"error unknown command {command}"]
+
+async def handle_client(reader, writer):
+    global game_counter
+    game_counter += 1
+    server_totals["games"] += 1
+    game = Game(game_counter)
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            tokens = line.decode(errors="replace").split()
+            if not tokens:
+                continue
+            if tokens[0].lower() == "quit":
+                break
+            for reply in await handle_command(game, tokens):
+                writer.write((reply + "\n").encode())
+            # Waits while the client is not reading its replies.
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        server_totals["games"] -= 1
+        writer.close()
+
+async def serve(host, port, workers):
+    global search_pool, search_slots
+    context = multiprocessing.get_context("spawn")
+    search_pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker)
+    search_slots = asyncio.Semaphore(workers)
+    server = await asyncio.start_server(handle_client, host, port)
+    print(f"listening on {', '.join(str(sock.getsockname()) for sock in server.sockets)} with {workers} search workers", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        search_pool.shutdown(cancel_futures=True)
+
+def main():
+    global max_pending
+    parser = argparse.ArgumentParser(description="Serve many concurrent games over a line-based TCP protocol.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--max-pending", type=int, default=64, help="answer busy once this many searches are queued or running")
+    args = parser.parse_args()
+
+    max_pending = args.max_pending
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import sys
+import threading
+import time
+import chess
+import engine
+
+engine_name = "Minimax Chess"
+engine_author = "Mhmd-Alami"
+eval_choices = {"E1": 1, "E2": 2, "E3": 3}
+board = chess.Board()
+eval_choice = 1
+search_thread = None
+stop_event = threading.Event()
+output_lock = threading.Lock()
+
+def send(line):
+    with output_lock:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+def format_score(score, pv):
+    # Engine scores are from the opponent's point of view; UCI wants the side to move.
+    score = -score
+    if abs(score) >= engine.MATE_SCORE:
+        moves = (len(pv) + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    return f"cp {int(score)}"
+
+def report_iteration(depth, score, nodes, elapsed, pv):
+    nps = int(nodes / elapsed) if elapsed > 0 else nodes
+    line = f"info depth {depth} nodes {nodes} nps {nps} time {int(elapsed * 1000)} score {format_score(score, pv)}"
+    if pv:
+        line += " pv " + " ".join(move.uci() for move in pv)
+    send(line)
+
+def set_position(tokens):
+    global board
+    if not tokens:
+        return
+    if tokens[0] == "startpos":
+        new_board = chess.Board()
+        rest = tokens[1:]
+    elif tokens[0] == "fen":
+        fen_end = tokens.index("moves") if "moves" in tokens else len(tokens)
+        new_board = chess.Board(" ".join(tokens[1:fen_end]))
+        rest = tokens[fen_end:]
+    else:
+        return
+    if rest and rest[0] == "moves":
+        for uci_move in rest[1:]:
+            new_board.push_uci(uci_move)
+    board = new_board
+
+def parse_go(tokens):
+    params = {}
+    index = 0
+    while index < len(tokens):
+        name = tokens[index]
+        if name in ("infinite", "ponder"):
+            params[name] = True
+            index += 1
+        elif index + 1 < len(tokens):
+            try:
+                params[name] = int(tokens[index + 1])
+            except ValueError:
+                pass
+            index += 2
+        else:
+            index += 1
+    return params
+
+def time_budget(params, turn):
+    if "movetime" in params:
+        return params["movetime"]
+    remaining = params.get("wtime" if turn == chess.WHITE else "btime")
+    if remaining is None:
+        return None
+    increment = params.get("winc" if turn == chess.WHITE else "binc", 0)
+    return engine.allocate_time(remaining, increment, params.get("movestogo"))
+
+def run_search(search_board, params):
+    infinite = params.get("infinite") or params.get("ponder")
+    time_limit = None if infinite else time_budget(params, search_board.turn)
+    max_depth = params.get("depth", engine.MAX_SEARCH_DEPTH)
+    book_move = None if infinite else engine.book_move(search_board)
+    engine.load_cached_position(search_board, eval_choice)
+    if book_move is not None:
+        best_move = book_move
+    elif "depth" in params and time_limit is None and not infinite and engine.search_workers > 1:
+        start = time.perf_counter()
+        start_nodes = engine.search_nodes
+        best_move = engine.get_best_move_parallel(search_board, max_depth, eval_choice)
+        # A search cut short by stop never completed the requested depth.
+        if best_move is not None and engine.last_search_complete:
+            report_iteration(max_depth, engine.last_score, engine.search_nodes - start_nodes, time.perf_counter() - start, [best_move])
+    else:
+        best_move, _ = engine.iterative_deepening(search_board, time_limit, eval_choice, max_depth, report_iteration)
+    if best_move is not None and book_move is None:
+        engine.save_search(search_board, eval_choice)
+    if infinite:
+        # UCI forbids sending bestmove for an infinite search before "stop".
+        stop_event.wait()
+    send(f"bestmove {best_move.uci() if best_move else '0000'}")
+
+def start_search(tokens):
+    global search_thread
+    stop_search()
+    params = parse_go(tokens)
+    stop_event.clear()
+    engine.stop_requested = False
+    search_thread = threading.Thread(target=run_search, args=(board.copy(), params), daemon=True)
+    search_thread.start()
+
+def stop_search():
+    global search_thread
+    if search_thread is not None:
+        engine.stop_search()
+        stop_event.set()
+        search_thread.join()
+        search_thread = None
+
+def set_option(tokens):
+    global eval_choice
+    if "name" not in tokens:
+        return
+    value_index = tokens.index("value") if "value" in tokens else len(tokens)
+    name = " ".join(tokens[tokens.index("name") + 1:value_index]).lower()
+    value = " ".join(tokens[value_index + 1:])
+    if name == "hash":
+        engine.set_hash_size(max(1, int(value)))
+    elif name == "threads":
+        engine.search_workers = max(1, int(value))
+    elif name == "evaluator" and value.upper() in eval_choices:
+        eval_choice = eval_choices[value.upper()]
+    elif name == "bookfile":
+        engine.open_book(value if value and value != "<empty>" else None)
+    elif name == "bookdepth":
+        engine.book_max_ply = max(0, int(value))
+    elif name in ("nullmove", "lmr", "pvs", "aspiration", "searchboard", "quiescence"):
+        setattr(engine, {"nullmove": "null_move_enabled", "lmr": "lmr_enabled", "pvs": "pvs_enabled", "aspiration": "aspiration_enabled",
+                         "searchboard": "search_board_enabled", "quiescence": "quiescence_enabled"}[name], value.lower() == "true")
+    elif name == "positioncache":
+        engine.open_position_cache(value if value and value != "<empty>" else None)
+    elif name == "positioncachesize":
+        engine.set_cache_size(max(1, int(value)))
+    elif name == "bookselection" and value.lower() in ("weighted", "best"):
+        engine.book_selection = value.lower()
+
+def main():
+    for line in sys.stdin:
+        tokens = line.split()
+        if not tokens:
+            continue
+        command = tokens[0]
+        if command == "uci":
+            send(f"id name {engine_name}")
+            send(f"id author {engine_author}")
+            send(f"option name Hash type spin default {engine.tt_megabytes} min 1 max 4096")
+            send(f"option name Threads type spin default {engine.search_workers} min 1 max 64")
+            send("option name Evaluator type combo default E1 var E1 var E2 var E3")
+            send("option name BookFile type string default <empty>")
+            send(f"option name BookDepth type spin default {engine.book_max_ply} min 0 max 100")
+            send("option name BookSelection type combo default weighted var weighted var best")
+            send("option name PositionCache type string default <empty>")
+            for option in ("NullMove", "LMR", "PVS", "Aspiration", "SearchBoard", "Quiescence"):
+                send(f"option name {option} type check default false")
+            send(f"option name PositionCacheSize type spin default {engine.cache_max_entries} min 1 max 100000000")
+            send("uciok")
+        elif command == "isready":
+            send("readyok")
+        elif command == "ucinewgame":
+            stop_search()
+            engine.new_game()
+        elif command == "position":
+            stop_search()
+            set_position(tokens[1:])
+        elif command == "go":
+            start_search(tokens[1:])
+        elif command in ("stop", "ponderhit"):
+            stop_search()
+        elif command == "setoption":
+            stop_search()
+            set_option(tokens[1:])
+        elif command == "quit":
+            break
+    stop_search()
+    engine.shutdown_search_pool()
+    engine.close_position_cache()
+
+if __name__ == "__main__":
+    main()